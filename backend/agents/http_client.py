@@ -0,0 +1,34 @@
+"""
+Shared HTTP Client
+One connection pool for every agent that talks to the Groq API
+"""
+
+from functools import lru_cache
+import os
+import httpx
+
+
+def groq_http_client() -> httpx.Client:
+    """
+    Keep-alive connection pool shared by all ChatGroq clients in the process.
+
+    The SQL generator, insights, visualization and summary agents all call the same
+    host, often back to back for one question; sharing the pool lets them reuse open
+    TCP/TLS connections instead of each agent handshaking on its own. httpx.Client is
+    thread-safe, so the API's worker threads and the experiment runner can share it.
+    Per-request timeouts are set on each ChatGroq (its request timeout overrides the
+    client's), so only the pool size and connect timeout are configured here.
+
+    The pool is per process: a forked child (e.g. a process-pool worker) would
+    otherwise inherit the parent's open sockets and interleave requests with it,
+    so each process id gets its own client.
+    """
+    return _client_for_process(os.getpid())
+
+
+@lru_cache(maxsize=None)
+def _client_for_process(pid: int) -> httpx.Client:
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
@@ -7,6 +7,12 @@ import os
 import pandas as pd
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+from agents.http_client import groq_http_client
 
 load_dotenv()
 
@@ -17,7 +23,8 @@ class InsightsGeneratorAgent:
         self.llm = ChatGroq(
             model="llama-3.3-70b-versatile",
             temperature=0.3,  # Slightly higher for more natural language
-            api_key=os.getenv('GROQ_API_KEY')
+            api_key=os.getenv('GROQ_API_KEY'),
+            http_client=groq_http_client()
         )
     
     def _format_dataframe(self, df: pd.DataFrame) -> str:
@@ -4,14 +4,50 @@ Executes SQL queries against the PostgreSQL database and returns results
 """
 
 import os
+from functools import lru_cache
 import psycopg2
 import pandas as pd
 from dotenv import load_dotenv
 from typing import Optional
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.sql_validator import validate_sql
+
+try:
+    # Optional SQL parser; catches syntax errors locally instead of with a database round trip
+    import sqlglot
+except ImportError:
+    sqlglot = None
 
 load_dotenv()
 
 
+# Deterministic generation hands back the same SQL text for repeated questions
+@lru_cache(maxsize=1024)
+def _syntax_error(sql_query: str) -> Optional[str]:
+    """
+    Parse sql_query as PostgreSQL, returning the parser's message if it is malformed.
+
+    Returns None for parseable SQL, and always when sqlglot is not installed; the
+    database remains the authority on anything that parses.
+    """
+    if sqlglot is None:
+        return None
+    try:
+        sqlglot.parse(sql_query, read="postgres")
+    except sqlglot.errors.ParseError as e:
+        if e.errors:
+            err = e.errors[0]
+            return f"Syntax error: {err['description']} (line {err['line']}, column {err['col']})"
+        return f"Syntax error: {e}"
+    except sqlglot.errors.TokenError as e:
+        return f"Syntax error: {e}"
+    return None
+
+
 class SQLExecutorAgent:
     def __init__(self):
         """Initialize the SQL Executor Agent with database connection."""
@@ -32,10 +68,20 @@ class SQLExecutorAgent:
             return self.conn
         except Exception as e:
             raise Exception(f"Database connection error: {str(e)}")
+
+    def _rollback(self):
+        """End the transaction a failed statement aborted, so the connection stays usable."""
+        if self.conn is not None and not self.conn.closed:
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
     
     def validate_query(self, sql_query: str) -> dict:
         """
         Validate SQL query using EXPLAIN without executing it.
+
+        Malformed SQL is rejected by a local parse first, without querying the database.
         
         Args:
             sql_query: SQL query to validate
@@ -43,6 +89,13 @@ class SQLExecutorAgent:
         Returns:
             Dictionary with 'is_valid' and 'error' keys
         """
+        error = _syntax_error(sql_query)
+        if error:
+            return {
+                "is_valid": False,
+                "error": error
+            }
+
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
@@ -58,6 +111,7 @@ class SQLExecutorAgent:
             }
             
         except Exception as e:
+            self._rollback()
             return {
                 "is_valid": False,
                 "error": str(e)
@@ -66,6 +120,9 @@ class SQLExecutorAgent:
     def execute(self, sql_query: str, return_df: bool = True) -> dict:
         """
         Execute SQL query and return results.
+
+        Only read-only queries are run: anything validate_sql() rejects (not a
+        SELECT/WITH, or containing e.g. DROP or UPDATE) is returned as an error.
         
         Args:
             sql_query: SQL query to execute
@@ -74,6 +131,16 @@ class SQLExecutorAgent:
         Returns:
             Dictionary with 'results', 'columns', 'row_count', and 'error' keys
         """
+        try:
+            validate_sql(sql_query)
+        except ValueError as e:
+            return {
+                "results": None,
+                "columns": None,
+                "row_count": 0,
+                "error": f"Rejected query: {e}"
+            }
+
         try:
             conn = self._get_connection()
             
@@ -103,6 +170,7 @@ class SQLExecutorAgent:
                 }
                 
         except Exception as e:
+            self._rollback()
             return {
                 "results": None,
                 "columns": None,
@@ -113,6 +181,9 @@ class SQLExecutorAgent:
     def execute_with_validation(self, sql_query: str, return_df: bool = True) -> dict:
         """
         Validate and execute SQL query.
+
+        Validation is the local syntax check only: a server-side EXPLAIN would cost a
+        round trip and catch nothing that executing the query doesn't report itself.
         
         Args:
             sql_query: SQL query to execute
@@ -122,14 +193,14 @@ class SQLExecutorAgent:
             Dictionary with execution results
         """
         # First validate
-        validation = self.validate_query(sql_query)
+        error = _syntax_error(sql_query)
         
-        if not validation["is_valid"]:
+        if error:
             return {
                 "results": None,
                 "columns": None,
                 "row_count": 0,
-                "error": validation["error"]
+                "error": error
             }
         
         # Then execute
@@ -3,8 +3,10 @@ SQL Generator Agent
 Converts natural language questions to SQL queries using few-shot prompting
 """
 
+import hashlib
 import os
-from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
+import re
+from typing import Mapping, Optional, Sequence
 from dotenv import load_dotenv
 import sys
 from pathlib import Path
@@ -12,90 +14,31 @@ from pathlib import Path
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 from few_shot_examples.examples import FEW_SHOT_EXAMPLES, SCHEMA_DESCRIPTION
-from few_shot_examples.semantic_selector import get_selector
+from few_shot_examples.semantic_selector import get_selector, SemanticCache
+from agents.http_client import groq_http_client
 
 load_dotenv()
 
-class SQLGeneratorAgent:
-    def __init__(self, model_name: str = None, use_semantic_selection: bool = True, max_examples: int = 5, provider: str = 'huggingface'):
-        """
-        Initialize the SQL Generator Agent.
-
-        Args:
-            model_name: Model name
-                       For Groq: 'llama-3.3-70b-versatile', 'mixtral-8x7b-32768'
-                       For HuggingFace: 'meta-llama/Meta-Llama-3-70B-Instruct', 'mistralai/Mixtral-8x7B-Instruct-v0.1'
-                       If None, uses default for provider
-            use_semantic_selection: If True, uses semantic similarity to select relevant examples
-                                   If False, uses all examples (may hit token limits)
-            max_examples: Maximum number of examples to use when semantic selection is enabled
-            provider: 'groq' or 'huggingface' (default: huggingface)
-        """
-        self.provider = provider.lower()
-
-        # Set default model based on provider
-        if model_name is None:
-            if self.provider == 'groq':
-                model_name = 'llama-3.3-70b-versatile'
-            else:  # huggingface
-                # Note: Llama 3.3 70B might not be available on Inference API yet
-                # Using Llama 3.1 70B which is confirmed available
-                model_name = 'meta-llama/Meta-Llama-3.1-70B-Instruct'
-
-        # Initialize LLM based on provider
-        if self.provider == 'groq':
-            from langchain_groq import ChatGroq
-            self.llm = ChatGroq(
-                model=model_name,
-                temperature=0,
-                api_key=os.getenv('GROQ_API_KEY')
-            )
-        elif self.provider == 'huggingface':
-            from langchain_huggingface import HuggingFaceEndpoint
-            self.llm = HuggingFaceEndpoint(
-                repo_id=model_name,
-                temperature=0.0,
-                max_new_tokens=512,
-                huggingfacehub_api_token=os.getenv('HUGGINGFACE_API_KEY')
-            )
-        else:
-            raise ValueError(f"Unsupported provider: {provider}. Use 'groq' or 'huggingface'")
-
-        self.use_semantic_selection = use_semantic_selection
-        self.max_examples = max_examples
+# Request bounds. The longest example query is ~400-500 tokens, so 1024 leaves room for
+# bigger CTEs while cutting off runaway explanations; a stalled call fails instead of
+# blocking the caller (API request, experiment worker) indefinitely.
+MAX_SQL_TOKENS = 1024
+LLM_TIMEOUT = 30  # seconds
+LLM_MAX_RETRIES = 3
 
-        # Initialize semantic selector if enabled
-        if use_semantic_selection:
-            self.semantic_selector = get_selector(FEW_SHOT_EXAMPLES)
-        else:
-            self.semantic_selector = None
+# Generation ends with the statement, so the model can't append explanations after it
+# (the provider stops producing, and billing, tokens there; the stop text isn't returned).
+# The stop matches the first ';' anywhere, including one inside a string literal or a
+# sentence before the query, and _clean_sql() then re-adds ';', so such output is cut
+# short while looking complete; execution is what catches it. fix_query() doesn't use
+# it, since its prompt quotes the broken SQL and the model tends to echo that back.
+STOP_SEQUENCES = [";"]
 
-        # Build base prompt template (examples will be added dynamically)
-        self.example_prompt_template = PromptTemplate(
-            input_variables=["question", "sql_query"],
-            template="Question: {question}\nSQL:\n{sql_query}\n"
-        )
-    
-    def _build_prompt(self, question: str) -> FewShotPromptTemplate:
-        """
-        Build the few-shot prompt template with semantically selected examples.
+# Table definitions; SQL learned against one version isn't reused once they change
+SCHEMA_FILE = Path(__file__).parent.parent / "db" / "schema.sql"
 
-        Args:
-            question: The user's question to find relevant examples for
-
-        Returns:
-            FewShotPromptTemplate configured with selected examples
-        """
-        # Select examples based on semantic similarity or use all
-        if self.use_semantic_selection and self.semantic_selector:
-            selected_examples = self.semantic_selector.select_examples(question, k=self.max_examples)
-        else:
-            selected_examples = FEW_SHOT_EXAMPLES
-
-        few_shot_prompt = FewShotPromptTemplate(
-            examples=selected_examples,
-            example_prompt=self.example_prompt_template,
-            prefix=f"""# TASK: Generate PostgreSQL SQL Query
+# Instructions and schema that open every generation prompt; examples and the question follow
+PROMPT_PREFIX = f"""# TASK: Generate PostgreSQL SQL Query
 
 You are a SQL code generator. Your ONLY job is to output valid PostgreSQL SQL queries based on the question.
 DO NOT provide explanations, apologies, or conversational responses.
@@ -126,7 +69,7 @@ ONLY output the SQL query code.
    - fp.fiscal_year conditions (e.g., = 2024 or IN (2023, 2024) or BETWEEN 2021 AND 2025)
 5. Include contextual data: prior years, YoY changes, percentages, averages
 6. Use window functions (LAG, LEAD, FIRST_VALUE, AVG OVER, RANK) for trends and comparisons
-7. Use CASE statements with MAX/GROUP BY for year pivots
+7. Use MAX(ff.value) FILTER (WHERE fp.fiscal_year = YYYY) with GROUP BY for year pivots
 8. Use CTEs for complex multi-metric analysis
 9. Handle NULLs with NULLIF in divisions to prevent division by zero
 10. Round percentages to 2 decimals, ratios to 2-3 decimals
@@ -144,32 +87,202 @@ For SIMPLE queries requesting a single metric:
 
 For COMPARISON queries (2 years):
   SELECT c.name as company_name,
-         MAX(CASE WHEN fp.fiscal_year = YYYY THEN ff.value END) as [year1_name],
-         MAX(CASE WHEN fp.fiscal_year = YYYY THEN ff.value END) as [year2_name],
+         MAX(ff.value) FILTER (WHERE fp.fiscal_year = YYYY) as [year1_name],
+         MAX(ff.value) FILTER (WHERE fp.fiscal_year = YYYY) as [year2_name],
          [variance calculations]
   GROUP BY c.name
 
 For TREND queries (multiple years with YoY):
   SELECT c.name as company_name, fp.fiscal_year, ff.value as [metric],
-         LAG(ff.value) OVER (ORDER BY fp.fiscal_year) as prev_year_value,
-         [YoY calculations using LAG]
+         LAG(ff.value) OVER w as prev_year_value,
+         [YoY calculations using LAG(...) OVER w]
+  WINDOW w AS (ORDER BY fp.fiscal_year)
   ORDER BY fp.fiscal_year
 
 Common Query Patterns:
-- Year comparison: Use CASE with MAX(CASE WHEN fiscal_year = X THEN value END) + GROUP BY
+- Year comparison: Use MAX(value) FILTER (WHERE fiscal_year = X) + GROUP BY
 - Trends: Use LAG() OVER (ORDER BY fiscal_year) for YoY calculations
 - Cumulative: Use FIRST_VALUE() OVER (ORDER BY fiscal_year) for growth from base year
-- Multi-metric: Use CTEs to join different metrics, then combine in final SELECT
+- Repeated windows: Name the window once (WINDOW w AS (ORDER BY fiscal_year)) and write OVER w in every window function that shares it
+- Multi-metric: Use one CTE that pivots the metrics per fiscal_year (normalized_code IN (...), MAX(ff.value) FILTER (WHERE li.normalized_code = ...), GROUP BY fp.fiscal_year) instead of one CTE per metric joined together
 - Composition: Calculate % using value / SUM(value) OVER (PARTITION BY...)
 - Ranking: Use RANK() OVER (ORDER BY value DESC)
 
 Examples:
-""",
-            suffix="Question: {question}\nSQL:",
-            input_variables=["question"]
-        )
-        
-        return few_shot_prompt
+"""
+
+# How each few-shot example appears in the prompt
+EXAMPLE_TEMPLATE = "Question: {question}\nSQL:\n{sql_query}\n"
+
+# Appended after the question, for code generation models
+GENERATE_INSTRUCTION = "\n\n### Instruction: Generate ONLY the SQL query code. Do not provide explanations or refuse. Output SQL directly."
+
+# Fixed parts of the fix_query() prompt; only the question, SQL and error vary between calls
+FIX_PROMPT_PREFIX = f"""The SQL query has an error. Fix it.
+
+Schema: {SCHEMA_DESCRIPTION}
+
+"""
+
+FIX_PROMPT_SUFFIX = """Common mistakes:
+- Using wrong table/column names
+- Missing JOINs
+- Incorrect normalized_code values (must start with HUL_)
+- Division by zero (use NULLIF)
+- Syntax errors
+
+Return ONLY the corrected SQL query, no explanations.
+Corrected SQL:"""
+
+_CODE_FENCE_RE = re.compile(r"```(?:sql)?")
+# Where the query starts: a WITH that leads into a SELECT, else the first SELECT
+_SQL_START_RE = re.compile(r"\b(?:WITH\b.*?\bSELECT|SELECT)\b", re.IGNORECASE | re.DOTALL)
+
+
+def _clean_sql(text: str) -> str:
+    """Strip markdown code fences and any explanation before the query's SELECT/WITH, ending it with ';'"""
+    sql = _CODE_FENCE_RE.sub("", text).strip()
+    match = _SQL_START_RE.search(sql)
+    if match:
+        sql = sql[match.start():]
+        # Restore the terminator the stop sequence cut off
+        if not sql.endswith(";"):
+            sql += ";"
+    return sql
+
+class SQLGeneratorAgent:
+    def __init__(self, model_name: str = None, use_semantic_selection: bool = True, max_examples: int = 5, provider: str = 'huggingface',
+                 examples: Optional[Sequence[Mapping[str, str]]] = None, semantic_cache: bool = False):
+        """
+        Initialize the SQL Generator Agent.
+
+        Args:
+            model_name: Model name
+                       For Groq: 'llama-3.3-70b-versatile', 'mixtral-8x7b-32768'
+                       For HuggingFace: 'meta-llama/Meta-Llama-3-70B-Instruct', 'mistralai/Mixtral-8x7B-Instruct-v0.1'
+                       If None, uses default for provider
+            use_semantic_selection: If True, uses semantic similarity to select relevant examples
+                                   If False, uses all examples (may hit token limits)
+            max_examples: Maximum number of examples to use when semantic selection is enabled
+            provider: 'groq' or 'huggingface' (default: huggingface)
+            examples: Few-shot example pool ('question'/'sql_query' mappings); defaults to
+                      FEW_SHOT_EXAMPLES. Owned by this agent, so agents with different
+                      pools can run side by side.
+            semantic_cache: If True (and semantic selection is on), near-duplicates of the
+                            example questions, or of questions passed to remember(), reuse
+                            that SQL without calling the LLM. Off by default so evaluations
+                            measure the model rather than a lookup of the example answers.
+        """
+        self.provider = provider.lower()
+
+        # Set default model based on provider
+        if model_name is None:
+            if self.provider == 'groq':
+                model_name = 'llama-3.3-70b-versatile'
+            else:  # huggingface
+                # Note: Llama 3.3 70B might not be available on Inference API yet
+                # Using Llama 3.1 70B which is confirmed available
+                model_name = 'meta-llama/Meta-Llama-3.1-70B-Instruct'
+        self.model_name = model_name
+
+        # Initialize LLM based on provider
+        if self.provider == 'groq':
+            from langchain_groq import ChatGroq
+            self.llm = ChatGroq(
+                model=model_name,
+                temperature=0,
+                api_key=os.getenv('GROQ_API_KEY'),
+                http_client=groq_http_client(),
+                max_tokens=MAX_SQL_TOKENS,
+                timeout=LLM_TIMEOUT,
+                max_retries=LLM_MAX_RETRIES
+            )
+        elif self.provider == 'huggingface':
+            from langchain_huggingface import HuggingFaceEndpoint
+            self.llm = HuggingFaceEndpoint(
+                repo_id=model_name,
+                temperature=0.0,
+                max_new_tokens=MAX_SQL_TOKENS,
+                timeout=LLM_TIMEOUT,
+                huggingfacehub_api_token=os.getenv('HUGGINGFACE_API_KEY')
+            )
+        else:
+            raise ValueError(f"Unsupported provider: {provider}. Use 'groq' or 'huggingface'")
+
+        self.use_semantic_selection = use_semantic_selection
+        self.max_examples = max_examples
+        self.semantic_cache = semantic_cache
+        self.set_examples(FEW_SHOT_EXAMPLES if examples is None else examples)
+    
+    def set_examples(self, examples: Sequence[Mapping[str, str]], max_examples: Optional[int] = None,
+                     exclude_same_question: bool = False) -> None:
+        """
+        Swap the few-shot example pool, keeping the LLM client.
+
+        Args:
+            examples: Examples with 'question' and 'sql_query' keys (may be empty for zero-shot)
+            max_examples: New cap on examples per prompt (unchanged if None)
+            exclude_same_question: With semantic selection, never put an example whose question
+                                   is the one being asked into its prompt (for evaluations
+                                   whose test questions overlap the pool)
+        """
+        self.examples = examples
+        self.exclude_same_question = exclude_same_question
+        if max_examples is not None:
+            self.max_examples = max_examples
+
+        # Initialize semantic selector if enabled
+        if self.use_semantic_selection and examples:
+            self.semantic_selector = get_selector(examples)
+        else:
+            self.semantic_selector = None
+
+        if self.semantic_cache and self.semantic_selector is not None:
+            # Near-duplicates of known questions reuse their SQL instead of calling the LLM
+            self.sql_cache = SemanticCache(
+                self.semantic_selector.example_embeddings,
+                [ex["question"] for ex in examples],
+                [ex["sql_query"] for ex in examples]
+            )
+        else:
+            self.sql_cache = None
+
+        # Without per-question selection everything before the question is fixed, so it is
+        # rendered once here and generate() only appends the question
+        self._static_prompt = self._render_prefix(examples) if self.semantic_selector is None else None
+
+    @staticmethod
+    def _render_prefix(examples: Sequence[Mapping[str, str]]) -> str:
+        """Instructions, schema and examples: the prompt up to the question"""
+        pieces = [PROMPT_PREFIX]
+        pieces.extend(EXAMPLE_TEMPLATE.format(question=ex["question"], sql_query=ex["sql_query"]) for ex in examples)
+        return "\n\n".join(pieces) + "\n\n"
+
+    def _build_prompt(self, question: str, question_embedding=None) -> str:
+        """
+        Build the few-shot prompt with semantically selected examples.
+
+        Plain string assembly: the template is fixed, so LangChain's prompt classes
+        (and their validation on every call) aren't needed.
+
+        Args:
+            question: The user's question to find relevant examples for
+            question_embedding: Precomputed selector embedding of the question (optional)
+
+        Returns:
+            The complete prompt text
+        """
+        if self._static_prompt is not None:
+            prefix = self._static_prompt
+        else:
+            # Select examples based on semantic similarity
+            selected_examples = self.semantic_selector.select_examples(
+                question, k=self.max_examples, question_embedding=question_embedding,
+                exclude_same_question=self.exclude_same_question
+            )
+            prefix = self._render_prefix(selected_examples)
+
+        return prefix + f"Question: {question}\nSQL:"
     
     def generate(self, question: str) -> dict:
         """
@@ -182,28 +295,27 @@ Examples:
             Dictionary with 'sql_query' and 'error' keys
         """
         try:
+            # Reuse known SQL for near-duplicate questions
+            question_embedding = None
+            if self.sql_cache is not None:
+                question_embedding = self.semantic_selector.encode(question)
+                cached_sql = self.sql_cache.lookup(question, question_embedding)
+                if cached_sql:
+                    return {
+                        "sql_query": cached_sql,
+                        "error": None
+                    }
+
             # Build prompt with semantically selected examples
-            prompt_template = self._build_prompt(question)
-            prompt = prompt_template.format(question=question)
+            prompt = self._build_prompt(question, question_embedding)
 
             # Add explicit instruction suffix for code generation models
-            prompt = prompt + "\n\n### Instruction: Generate ONLY the SQL query code. Do not provide explanations or refuse. Output SQL directly."
+            prompt = prompt + GENERATE_INSTRUCTION
 
-            response = self.llm.invoke(prompt)
+            response = self.llm.invoke(prompt, stop=STOP_SEQUENCES)
 
             # Clean SQL query - ChatGroq returns AIMessage object with .content
-            sql_query = response.content.strip() if hasattr(response, 'content') else str(response).strip()
-            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-            
-            # Remove any explanatory text before SELECT/WITH
-            if "SELECT" in sql_query.upper():
-                select_pos = sql_query.upper().find("SELECT")
-                with_pos = sql_query.upper().find("WITH")
-                
-                if with_pos != -1 and (select_pos == -1 or with_pos < select_pos):
-                    sql_query = sql_query[with_pos:]
-                elif select_pos != -1:
-                    sql_query = sql_query[select_pos:]
+            sql_query = _clean_sql(response.content if hasattr(response, 'content') else str(response))
             
             return {
                 "sql_query": sql_query,
@@ -216,6 +328,47 @@ Examples:
                 "error": f"SQL Generation Error: {str(e)}"
             }
     
+    def remember(self, question: str, sql_query: str) -> None:
+        """
+        Record SQL that executed successfully so near-duplicate questions can reuse it.
+
+        Args:
+            question: Question the SQL answered
+            sql_query: The working SQL
+        """
+        if self.sql_cache is not None:
+            self.sql_cache.insert(question, self.semantic_selector.encode(question), sql_query)
+
+    def clear_cache(self) -> None:
+        """Forget SQL recorded via remember(); the example SQL stays cached."""
+        if self.sql_cache is not None:
+            self.sql_cache.clear()
+
+    def save_cache(self, path: Path) -> None:
+        """Write SQL recorded via remember() to path (.npy + .json) for load_cache()."""
+        if self.sql_cache is not None:
+            self.sql_cache.save(path, self._encoder_name(), self._cache_fingerprint())
+
+    def load_cache(self, path: Path) -> int:
+        """Restore SQL saved by save_cache(); returns the number of entries restored."""
+        if self.sql_cache is None:
+            return 0
+        return self.sql_cache.load(path, self._encoder_name(), self._cache_fingerprint())
+
+    def _encoder_name(self) -> str:
+        return f"{self.semantic_selector.model_name}@{self.semantic_selector.backend}"
+
+    def _cache_fingerprint(self) -> str:
+        """Digest of what saved SQL depends on: the example pool, the prompt and db/schema.sql"""
+        digest = hashlib.sha1(PROMPT_PREFIX.encode("utf-8"))
+        for ex in self.examples:
+            digest.update(f"\0{ex['question']}\0{ex['sql_query']}".encode("utf-8"))
+        try:
+            digest.update(SCHEMA_FILE.read_bytes())
+        except OSError:
+            pass
+        return digest.hexdigest()
+
     def fix_query(self, question: str, broken_sql: str, error: str) -> dict:
         """
         Attempt to fix a broken SQL query.
@@ -228,38 +381,15 @@ Examples:
         Returns:
             Dictionary with fixed 'sql_query' and 'error' keys
         """
-        fix_prompt = f"""The SQL query has an error. Fix it.
-
-Schema: {SCHEMA_DESCRIPTION}
-
-Question: {question}
+        fix_prompt = FIX_PROMPT_PREFIX + f"""Question: {question}
 Broken SQL: {broken_sql}
 Error: {error}
 
-Common mistakes:
-- Using wrong table/column names
-- Missing JOINs
-- Incorrect normalized_code values (must start with HUL_)
-- Division by zero (use NULLIF)
-- Syntax errors
-
-Return ONLY the corrected SQL query, no explanations.
-Corrected SQL:"""
+""" + FIX_PROMPT_SUFFIX
         
         try:
             response = self.llm.invoke(fix_prompt)
-            fixed_query = response.content.strip() if hasattr(response, 'content') else str(response).strip()
-            fixed_query = fixed_query.replace("```sql", "").replace("```", "").strip()
-            
-            # Extract SQL portion
-            if "SELECT" in fixed_query.upper():
-                select_pos = fixed_query.upper().find("SELECT")
-                with_pos = fixed_query.upper().find("WITH")
-                
-                if with_pos != -1 and (select_pos == -1 or with_pos < select_pos):
-                    fixed_query = fixed_query[with_pos:]
-                elif select_pos != -1:
-                    fixed_query = fixed_query[select_pos:]
+            fixed_query = _clean_sql(response.content if hasattr(response, 'content') else str(response))
             
             return {
                 "sql_query": fixed_query,
@@ -8,6 +8,12 @@ from langchain_groq import ChatGroq
 from langchain_community.utilities import SQLDatabase
 from dotenv import load_dotenv
 import pandas as pd
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+from agents.http_client import groq_http_client
 
 load_dotenv()
 
@@ -23,7 +29,8 @@ class SummaryAgent:
         self.llm = ChatGroq(
             model="llama-3.3-70b-versatile",
             temperature=0.2,
-            api_key=os.getenv('GROQ_API_KEY')
+            api_key=os.getenv('GROQ_API_KEY'),
+            http_client=groq_http_client()
         )
         
         # Build database connection
@@ -12,6 +12,11 @@ from typing import Dict, List, Optional, Tuple
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
 import json
+import sys
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+from agents.http_client import groq_http_client
 
 load_dotenv()
 
@@ -31,7 +36,8 @@ class VisualizerAgent:
         self.llm = ChatGroq(
             model="llama-3.3-70b-versatile",
             temperature=0,
-            api_key=os.getenv('GROQ_API_KEY')
+            api_key=os.getenv('GROQ_API_KEY'),
+            http_client=groq_http_client()
         )
         
         self.chart_types = {
@@ -514,6 +520,28 @@ Return JSON only:"""
             plt.xticks(rotation=45, ha='right')
 
 
+# Per-process agent used when charts are rendered in a worker pool
+_worker_agent: Optional[VisualizerAgent] = None
+
+
+def render_visualizations(question: str, results: pd.DataFrame, output_dir: str = "output") -> Dict:
+    """
+    Process-pool entry point for analyze_and_visualize.
+
+    matplotlib holds the GIL while rendering and is not thread-safe across
+    figures, so the API runs this in worker processes. Each worker builds
+    its own VisualizerAgent on first use.
+    """
+    global _worker_agent
+    if _worker_agent is None:
+        _worker_agent = VisualizerAgent()
+    return _worker_agent.analyze_and_visualize(
+        question=question,
+        results=results,
+        output_dir=output_dir
+    )
+
+
 if __name__ == "__main__":
     # Test the agent
     agent = VisualizerAgent()
@@ -7,11 +7,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
+import os
 import sys
+import re
+import asyncio
 from pathlib import Path
 import uuid
 import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from cachetools import TTLCache
 
 # Add agents to path
 sys.path.append(str(Path(__file__).parent))
@@ -19,8 +26,9 @@ sys.path.append(str(Path(__file__).parent))
 from agents.sql_generator import SQLGeneratorAgent
 from agents.sql_executor import SQLExecutorAgent
 from agents.insights_generator import InsightsGeneratorAgent
-from agents.visualizer import VisualizerAgent
+from agents.visualizer import render_visualizations
 from agents.summary_agent import SummaryAgent
+from utils.columnar import to_columnar
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -39,15 +47,80 @@ app.add_middleware(
 )
 
 # Initialize agents
-sql_generator = SQLGeneratorAgent()
+sql_generator = SQLGeneratorAgent(semantic_cache=True)
 sql_executor = SQLExecutorAgent()
 insights_generator = InsightsGeneratorAgent()
-visualizer = VisualizerAgent()
 summary_agent = SummaryAgent()
 
+# Chart rendering runs in separate processes (matplotlib is GIL-heavy and not thread-safe);
+# created at startup by start_viz_executor()
+viz_executor: Optional[ProcessPoolExecutor] = None
+
 # In-memory storage for analysis results
 analysis_cache = {}
 
+# Documents are in backend/income_statements
+_DOCS_DIR = Path("income_statements").resolve()
+_BAD_NAME = re.compile(r"[\\/]|\.\.")
+
+# Memoized LLM calls: SQL that ran successfully per question, fixed SQL per (question, broken_sql, error)
+_sql_cache_lock = threading.Lock()
+_generate_cache = TTLCache(maxsize=512, ttl=1800)
+_fix_cache = TTLCache(maxsize=512, ttl=1800)
+_generate_cache_stats = {"hits": 0, "misses": 0}
+
+_WHITESPACE = re.compile(r"\s+")
+
+# SQL the generator learned from successful runs, kept across restarts (next to the
+# example embedding cache, which is gitignored)
+_LEARNED_SQL_PATH = Path(__file__).parent / "few_shot_examples" / ".embedding_cache" / "learned_sql"
+
+
+def _question_key(question: str) -> str:
+    """Cache key for a question; case, spacing and trailing punctuation don't change the SQL"""
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?.!").rstrip().lower()
+
+
+def _cached_generate(question: str) -> dict:
+    """
+    Generate SQL for a question, reusing SQL that recently ran successfully for it.
+
+    Cache hits are marked with "cached": True; that SQL is known to execute.
+    """
+    with _sql_cache_lock:
+        cached = _generate_cache.get(_question_key(question))
+        _generate_cache_stats["hits" if cached is not None else "misses"] += 1
+    if cached is not None:
+        return {"sql_query": cached, "error": None, "cached": True}
+
+    return sql_generator.generate(question)
+
+
+def _remember_sql(question: str, sql_query: str) -> None:
+    """Record SQL that executed successfully (after any fixes) as the answer to a question"""
+    with _sql_cache_lock:
+        _generate_cache[_question_key(question)] = sql_query
+    sql_generator.remember(question, sql_query)
+
+
+def _cached_fix(question: str, broken_sql: str, error: str) -> dict:
+    """Fix a broken SQL query, reusing a recent successful fix for the same failure"""
+    key = (_question_key(question), broken_sql, error)
+    with _sql_cache_lock:
+        cached = _fix_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = sql_generator.fix_query(
+        question=question,
+        broken_sql=broken_sql,
+        error=error
+    )
+    if not result["error"]:
+        with _sql_cache_lock:
+            _fix_cache[key] = result
+    return result
+
 
 # Pydantic models
 class AnalysisRequest(BaseModel):
@@ -59,7 +132,7 @@ class AnalysisResponse(BaseModel):
     analysis_id: str
     question: str
     sql_query: Optional[str]
-    results: Optional[List[Dict]]
+    results: Optional[Dict[str, List]]  # columnar: {column: [values...]}
     columns: Optional[List[str]]
     row_count: int
     insights: Optional[str]
@@ -76,6 +149,51 @@ class HealthResponse(BaseModel):
 
 # Routes
 
+@app.on_event("startup")
+def load_learned_sql():
+    """Restore the SQL the generator learned before the last shutdown"""
+    sql_generator.load_cache(_LEARNED_SQL_PATH)
+
+
+@app.on_event("startup")
+def warm_up_selector():
+    """Load the example selector's encoder in the background instead of on the first request"""
+    if sql_generator.semantic_selector is not None:
+        threading.Thread(
+            target=sql_generator.semantic_selector.warm_up,
+            name="selector-warmup",
+            daemon=True
+        ).start()
+
+
+@app.on_event("startup")
+def start_viz_executor():
+    """
+    Start the chart rendering worker pool.
+
+    Workers are spawned, not forked: by now this process has worker threads and
+    open keep-alive connections in the shared Groq HTTP client, and a forked
+    worker would inherit both and write to sockets this process is still using.
+    """
+    global viz_executor
+    viz_executor = ProcessPoolExecutor(
+        max_workers=max(1, (os.cpu_count() or 2) // 2),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+@app.on_event("shutdown")
+def shutdown_viz_executor():
+    """Stop chart rendering workers"""
+    viz_executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.on_event("shutdown")
+def save_learned_sql():
+    """Keep the SQL learned during this run for the next start"""
+    sql_generator.save_cache(_LEARNED_SQL_PATH)
+
+
 @app.get("/", response_model=Dict)
 async def root():
     """Root endpoint"""
@@ -166,7 +284,8 @@ async def analyze_question(request: AnalysisRequest):
     
     try:
         # Step 1: Generate SQL
-        sql_result = sql_generator.generate(request.question)
+        # LLM calls run on a worker thread so other requests aren't blocked behind them
+        sql_result = await asyncio.to_thread(_cached_generate, request.question)
         
         if sql_result["error"]:
             return AnalysisResponse(
@@ -191,17 +310,22 @@ async def analyze_question(request: AnalysisRequest):
         execution_result = None
         
         while attempt <= max_retry:
-            execution_result = sql_executor.execute_with_validation(
-                sql_query,
-                return_df=True
-            )
+            if attempt == 0 and sql_result.get("cached"):
+                # Cached SQL has run successfully before; skip straight to execution
+                execution_result = sql_executor.execute(sql_query, return_df=True)
+            else:
+                execution_result = sql_executor.execute_with_validation(
+                    sql_query,
+                    return_df=True
+                )
             
             if not execution_result["error"]:
                 break
             
             if attempt < max_retry:
                 # Try to fix SQL
-                fix_result = sql_generator.fix_query(
+                fix_result = await asyncio.to_thread(
+                    _cached_fix,
                     question=request.question,
                     broken_sql=sql_query,
                     error=execution_result["error"]
@@ -255,13 +379,26 @@ async def analyze_question(request: AnalysisRequest):
                 status="error"
             )
         
-        # Convert DataFrame to list of dicts
+        # Convert DataFrame to columnar dict
         results_df = execution_result["results"]
-        results_list = results_df.to_dict('records')
-        columns = results_df.columns.tolist()
+        columns, results_columns = to_columnar(results_df)
+        
+        # Steps 3 and 4 only read the question and results, so the insights LLM
+        # call and the visualization worker run concurrently
+        viz_future = None
+        if request.enable_visualization:
+            loop = asyncio.get_running_loop()
+            viz_future = loop.run_in_executor(
+                viz_executor,
+                render_visualizations,
+                request.question,
+                results_df,
+                "output"
+            )
         
         # Step 3: Generate Insights
-        insights_result = insights_generator.generate(
+        insights_result = await asyncio.to_thread(
+            insights_generator.generate,
             question=request.question,
             sql_query=sql_query,
             results=results_df
@@ -271,36 +408,34 @@ async def analyze_question(request: AnalysisRequest):
         summary = insights_result.get("summary")
         
         # Step 4: Create Visualizations (if enabled)
-        viz_result = None
-        if request.enable_visualization:
-            viz_result = visualizer.analyze_and_visualize(
-                question=request.question,
-                results=results_df,
-                output_dir="output"
-            )
+        viz_result = await viz_future if viz_future is not None else None
         
         # Cache the result
         analysis_cache[analysis_id] = {
             "question": request.question,
             "sql_query": sql_query,
-            "results": results_list,
+            "results": results_columns,
             "insights": insights,
             "visualizations": viz_result
         }
         
-        return AnalysisResponse(
+        response = AnalysisResponse(
             analysis_id=analysis_id,
             question=request.question,
             sql_query=sql_query,
-            results=results_list,
+            results=results_columns,
             columns=columns,
-            row_count=len(results_list),
+            row_count=len(results_df),
             insights=insights,
             summary=summary,
             visualizations=viz_result,
             error=None,
             status="success"
         )
+
+        # Only SQL that produced a complete response is reused for the question
+        _remember_sql(request.question, sql_query)
+        return response
         
     except Exception as e:
         return AnalysisResponse(
@@ -319,6 +454,7 @@ async def analyze_question(request: AnalysisRequest):
 
 
 @app.get("/api/chart/{filename}")
+@app.head("/api/chart/{filename}")
 async def get_chart(filename: str):
     """Serve chart images"""
     file_path = Path("output") / filename
@@ -326,7 +462,12 @@ async def get_chart(filename: str):
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Chart not found")
     
-    return FileResponse(file_path, media_type="image/png")
+    return FileResponse(
+        file_path,
+        media_type="image/png",
+        stat_result=file_path.stat(),
+        headers={"Accept-Ranges": "bytes"}
+    )
 
 
 @app.get("/api/analysis/{analysis_id}")
@@ -348,6 +489,30 @@ async def delete_analysis(analysis_id: str):
     raise HTTPException(status_code=404, detail="Analysis not found")
 
 
+@app.get("/api/sql-cache")
+async def get_sql_cache_stats():
+    """Size and hit ratio of the generated-SQL cache"""
+    with _sql_cache_lock:
+        hits, misses = _generate_cache_stats["hits"], _generate_cache_stats["misses"]
+        entries = len(_generate_cache)
+    return {
+        "entries": entries,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0
+    }
+
+
+@app.delete("/api/sql-cache")
+async def clear_sql_cache():
+    """Clear memoized SQL generation results"""
+    with _sql_cache_lock:
+        _generate_cache.clear()
+        _fix_cache.clear()
+    sql_generator.clear_cache()
+    return {"message": "SQL cache cleared"}
+
+
 @app.get("/api/summary")
 async def get_summary():
     """
@@ -410,25 +575,32 @@ async def get_documents():
 
 
 @app.get("/api/documents/{filename}")
+@app.head("/api/documents/{filename}")
 async def get_document(filename: str):
     """
     Serve a specific financial statement document
     """
     try:
         # Security: prevent path traversal
-        if ".." in filename or "/" in filename or "\\" in filename:
+        if _BAD_NAME.search(filename):
             raise HTTPException(status_code=400, detail="Invalid filename")
 
-        # Documents are in backend/income_statements
-        file_path = Path("income_statements") / filename
+        file_path = (_DOCS_DIR / filename).resolve()
+        if not file_path.is_relative_to(_DOCS_DIR):
+            raise HTTPException(status_code=400, detail="Invalid filename")
 
-        if not file_path.exists():
+        try:
+            stat_result = file_path.stat()
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Document not found")
 
+        # Range requests let the PDF viewer fetch pages without downloading the whole file
         return FileResponse(
             file_path,
             media_type="application/pdf",
-            filename=filename
+            filename=filename,
+            stat_result=stat_result,
+            headers={"Accept-Ranges": "bytes"}
         )
 
     except HTTPException:
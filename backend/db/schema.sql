@@ -59,4 +59,9 @@ CREATE TABLE IF NOT EXISTS financial_fact (
     value NUMERIC,
     note TEXT,
     source_page INT
-);
\ No newline at end of file
+);
+-- Generated queries look up a metric by normalized_code (unique index above) and then
+-- fetch its facts by line_item_id, joining each fact's statement; Postgres does not
+-- index foreign key columns on its own
+CREATE INDEX IF NOT EXISTS idx_financial_fact_line_item
+    ON financial_fact(line_item_id, statement_id);
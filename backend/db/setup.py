@@ -16,19 +16,26 @@ Notes:
 - The script will create company, fiscal_period, statement, line_item, financial_fact entries.
 """
 
+import io
 import os
 import re
 import sys
-import math
 import logging
 from datetime import date
 from dotenv import load_dotenv
 
 import pandas as pd
 import numpy as np
+import openpyxl
 import psycopg2
 from psycopg2 import sql, extras
 
+try:
+    # Rust XLSX reader; much faster than openpyxl on big sheets
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
 # -------------------------
 # Config / env
 # -------------------------
@@ -44,7 +51,14 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 EXCEL_FOLDER = os.path.join(PROJECT_ROOT, "excel")
 DB_SCHEMA_FILE = os.path.join(PROJECT_ROOT, "schema.sql")
 
-NA_VALUES = {"N.A.", "NA", "na", "-", "--", "", " ", None}
+NA_VALUES = frozenset({"N.A.", "NA", "na", "-", "--", "", " ", None})
+
+# Compiled once; the helpers below run per cell/row
+_YEAR_RE = re.compile(r"(\d{2,4})")
+_PAREN_RE = re.compile(r"^\(.*\)$")
+_SLUG_RE = re.compile(r"[^0-9A-Za-z_]+")
+_DIGIT_UNDERSCORE_RE = re.compile(r"(?<=\d)_(?=\d)")
+_MAR_RE = re.compile(r"Mar", re.I)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -59,7 +73,7 @@ def parse_year_from_col(col_label):
     """Extract a 4-digit year from various column headings like 'Mar 25', 'Mar-24', \"Mar '25\"."""
     s = str(col_label)
     # search for 2- or 4-digit number
-    m = re.search(r"(\d{2,4})", s)
+    m = _YEAR_RE.search(s)
     if not m:
         return None
     y = int(m.group(1))
@@ -69,15 +83,19 @@ def parse_year_from_col(col_label):
 
 def clean_numeric(value):
     """Converts Excel cell to float if possible. Handles commas, parentheses, percents, and NA placeholders."""
-    if isinstance(value, (int, float, np.number)) and not (isinstance(value, float) and math.isnan(value)):
-        return float(value)
+    # fast paths: most cells are already numbers (NaN != NaN)
+    if type(value) is float:
+        return value if value == value else None
+    if isinstance(value, (int, np.integer, np.floating)):
+        value = float(value)
+        return value if value == value else None
     if value is None:
         return None
     s = str(value).strip()
     if s in NA_VALUES:
         return None
     # parentheses negative e.g. (1,234)
-    if re.match(r"^\(.*\)$", s):
+    if s[:1] == "(" and s[-1:] == ")":
         s = "-" + s[1:-1]
     # remove commas and percentage sign
     s = s.replace(",", "").replace("%", "")
@@ -86,15 +104,47 @@ def clean_numeric(value):
     except Exception:
         return None
 
+def clean_numeric_series(s):
+    """
+    Vectorized clean_numeric over a whole column. Returns float64 with NaN for missing/non-numeric cells.
+
+    Matches clean_numeric cell for cell, except that digits outside ASCII (e.g. '١٢' or
+    full-width '１２') and bytes cells are not converted; Excel exports neither.
+    """
+    # columns pandas already inferred as numbers need no string handling
+    if s.dtype.kind in "fiu":
+        return s.astype("float64")
+    out = pd.to_numeric(s, errors="coerce").astype("float64")
+    # only cells that did not parse as plain numbers go through the string path
+    rest = out.isna() & s.notna()
+    if not rest.any():
+        return out
+    t = s[rest].astype("string").str.strip()
+    t = t.mask(t.isin(NA_VALUES))
+    # parentheses negative e.g. (1,234)
+    neg = t.str.match(_PAREN_RE, na=False)
+    t = t.where(~neg, "-" + t.str.slice(1, -1))
+    # remove commas and percentage sign, and digit-group underscores as float() does ('1_000')
+    t = t.str.replace(",", "", regex=False).str.replace("%", "", regex=False)
+    t = t.str.replace(_DIGIT_UNDERSCORE_RE, "", regex=True)
+    out[rest] = pd.to_numeric(t, errors="coerce").astype("float64")
+    return out
+
 def slugify_code(*parts, max_len=100):
     """Create a normalized_code from parts, safe for DB unique constraint."""
     joined = "_".join(parts)
     # remove non-alphanumeric (allow underscore)
-    joined = re.sub(r"[^0-9A-Za-z_]+", "_", joined).strip("_")
+    joined = _SLUG_RE.sub("_", joined).strip("_")
     if len(joined) > max_len:
         joined = joined[:max_len]
     return joined.upper()
 
+def slugify_codes(labels, *prefix, max_len=100):
+    """Vectorized slugify_code(*prefix, label) over a Series of labels."""
+    joined = "_".join(prefix + ("",)) + labels
+    joined = joined.str.replace(_SLUG_RE, "_", regex=True).str.strip("_")
+    return joined.str.slice(0, max_len).str.upper()
+
 def detect_statement_type_from_filename(filename):
     n = filename.lower()
     if "p&l" in n or "income_statement" in n or "p_l" in n or ("income" in n and "statement" in n):
@@ -153,35 +203,127 @@ def get_or_create_fiscal_period(cursor, company_id, fiscal_year, fiscal_quarter=
     )
     return cursor.fetchone()[0]
 
-def create_statement(cursor, period_id, statement_type, currency="INR", units="CRORES"):
-    cursor.execute(
+def create_statements(cursor, period_ids, statement_type, currency="INR", units="CRORES"):
+    """Insert one statement per period of {fiscal_year: period_id} in a single batch.
+       Returns {fiscal_year: statement_id}."""
+    rows = extras.execute_values(
+        cursor,
         """INSERT INTO statement (period_id, statement_type, currency, units)
-           VALUES (%s, %s, %s, %s)
-           RETURNING statement_id""",
-        (period_id, statement_type.upper(), currency, units)
+           VALUES %s
+           RETURNING statement_id, period_id""",
+        [(period_id, statement_type.upper(), currency, units) for period_id in period_ids.values()],
+        page_size=max(len(period_ids), 1),
+        fetch=True
     )
-    return cursor.fetchone()[0]
-
-def get_or_create_line_item(cursor, name, normalized_code, statement_category, description=None):
+    # RETURNING order is not guaranteed; map back through period_id
+    fy_by_period = {period_id: fy for fy, period_id in period_ids.items()}
+    return {fy_by_period[period_id]: statement_id for statement_id, period_id in rows}
+
+def resolve_line_item_ids(cursor, line_items):
+    """Map normalized_code -> line_item_id for {normalized_code: (name, statement_category)}.
+       Existing codes are fetched in one query; missing ones are upserted in one
+       execute_values batch (page_size covers a whole sheet)."""
+    codes = list(line_items)
     cursor.execute(
-        """INSERT INTO line_item (name, normalized_code, statement_category, description)
-           VALUES (%s, %s, %s, %s)
-           ON CONFLICT (normalized_code) DO UPDATE SET name = EXCLUDED.name
-           RETURNING line_item_id""",
-        (name, normalized_code, statement_category, description)
+        "SELECT normalized_code, line_item_id FROM line_item WHERE normalized_code = ANY(%s)",
+        (codes,)
     )
-    return cursor.fetchone()[0]
-
-def insert_financial_fact(cursor, statement_id, line_item_id, value, note=None, source_page=None):
-    cursor.execute(
-        """INSERT INTO financial_fact (statement_id, line_item_id, value, note, source_page)
-           VALUES (%s, %s, %s, %s, %s)""",
-        (statement_id, line_item_id, value, note, source_page)
+    line_item_ids = dict(cursor.fetchall())
+    missing = [
+        (line_items[code][0], code, line_items[code][1], None)
+        for code in codes if code not in line_item_ids
+    ]
+    if missing:
+        rows = extras.execute_values(
+            cursor,
+            """INSERT INTO line_item (name, normalized_code, statement_category, description)
+               VALUES %s
+               ON CONFLICT (normalized_code) DO UPDATE SET name = EXCLUDED.name
+               RETURNING normalized_code, line_item_id""",
+            missing,
+            page_size=500,
+            fetch=True
+        )
+        line_item_ids.update(rows)
+    return line_item_ids
+
+def copy_financial_facts(cursor, facts):
+    """Bulk-load (statement_id, line_item_id, value) rows into financial_fact with a single COPY."""
+    buf = io.StringIO()
+    for statement_id, line_item_id, value in facts:
+        buf.write(f"{statement_id}\t{line_item_id}\t{float(value)}\t\\N\t\\N\n")
+    buf.seek(0)
+    cursor.copy_expert(
+        "COPY financial_fact (statement_id, line_item_id, value, note, source_page) FROM STDIN WITH (FORMAT text)",
+        buf
     )
 
 # -------------------------
 # Parsing + Loader
 # -------------------------
+def _read_rows_calamine(filepath):
+    sheet = CalamineWorkbook.from_path(filepath).get_sheet_by_index(0)
+    # calamine reports empty cells as ""; use None like openpyxl
+    return [[None if v == "" else v for v in row] for row in sheet.to_python()]
+
+def _read_rows_openpyxl(filepath):
+    wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # some writers store a wrong <dimension>; let iter_rows find the real extent
+        ws.reset_dimensions()
+        return [list(row) for row in ws.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+def read_sheet_rows(filepath):
+    """Read the first worksheet once as a list of value rows (calamine if installed, else openpyxl).
+       Trailing empty cells and rows are trimmed and rows padded to a common width, as pd.read_excel does."""
+    raw = None
+    if CalamineWorkbook is not None:
+        try:
+            raw = _read_rows_calamine(filepath)
+        except Exception as e:
+            logger.debug(f"calamine could not read {filepath}: {e}; falling back to openpyxl")
+    if raw is None:
+        raw = _read_rows_openpyxl(filepath)
+
+    rows = []
+    last_nonempty = 0
+    for row in raw:
+        while row and (row[-1] is None or row[-1] == ""):
+            row.pop()
+        rows.append(row)
+        if row:
+            last_nonempty = len(rows)
+    rows = rows[:last_nonempty]
+    width = max((len(r) for r in rows), default=0)
+    return [r + [None] * (width - len(r)) for r in rows]
+
+def header_names(rows, header=0):
+    """Column names pd.read_excel would give for header row `header` (None = positional integers)."""
+    if header is None:
+        return list(range(len(rows[0]) if rows else 0))
+    columns = []
+    seen = {}
+    for i, c in enumerate(rows[header]):
+        name = f"Unnamed: {i}" if c is None or c == "" else c
+        # de-duplicate repeated headings the same way pandas does ('x', 'x.1', ...)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def frame_from_rows(rows, header=0):
+    """Build a DataFrame from read_sheet_rows output using row `header` as column names
+       (None = positional integer columns)."""
+    if header is None:
+        return pd.DataFrame(rows)
+    return pd.DataFrame(rows[header + 1:], columns=header_names(rows, header))
+
 def categorize_line_item(statement_type, item_name):
     n = item_name.lower()
     if statement_type == "balance":
@@ -210,54 +352,36 @@ def categorize_line_item(statement_type, item_name):
         return "RATIO"
     return "OTHER"
 
-def is_section_header(item_name, value_cols):
-    """Return True if row looks like a section header (uppercase words, no numeric values)."""
-    if item_name is None:
-        return False
-    s = str(item_name).strip()
-    # if all characters are uppercase letters, spaces, ampersand and punctuation it's likely a header
-    if re.fullmatch(r"[A-Z0-9\s\-\&\,\:\(\)\/]+", s) and s == s.upper():
-        # check if the corresponding value columns are all empty/NA
-        if value_cols.isna().all():
-            return True
-    return False
-
-def load_excel_file(cursor, filepath, company_id, period_ids):
+def load_excel_file(cursor, filepath, company_id, period_ids=None):
+    """Load one statement sheet. period_ids (fiscal_year -> period_id) is filled in
+       as periods are created; returns the set of fiscal years found in the file."""
     filename = os.path.basename(filepath)
     statement_type = detect_statement_type_from_filename(filename)
     if statement_type == "unknown":
         logger.warning(f"Unknown statement type for file: {filename}. Skipping.")
-        return
+        return set()
 
-    # read excel defensively: attempt a header row detection strategy
+    # read the workbook once and sniff the header row from the raw rows
     # Many of your files have two rows above: "Mar xx" row and "12 mths" row; actual header row often at index 0 or 2.
-    df = None
-    tried = []
+    rows = read_sheet_rows(filepath)
+    if not rows:
+        logger.warning(f"Empty sheet: {filename}. Skipping.")
+        return set()
+    # only the candidate header cells are inspected; the frame is built once
+    header_row = 0
     for header_guess in [0, 1, 2, None]:
-        try:
-            if header_guess is None:
-                temp = pd.read_excel(filepath, header=None)
-            else:
-                temp = pd.read_excel(filepath, header=header_guess)
-            # drop fully empty rows
-            temp = temp.dropna(how="all")
-            # try to locate columns that look like "Mar" columns
-            cols = list(temp.columns)
-            if any(re.search(r"Mar", str(c), flags=re.I) or re.search(r"\bMar\b", str(c)) for c in cols):
-                df = temp
-                break
-            # fallback: if first row contains year-like columns
-            if any(re.search(r"\d{2,4}", str(c)) for c in cols):
-                df = temp
-                break
-            tried.append(header_guess)
-        except Exception as e:
-            logger.debug(f"header_guess {header_guess} failed: {e}")
+        if header_guess is not None and header_guess >= len(rows):
             continue
+        cols = header_names(rows, header_guess)
+        # try to locate columns that look like "Mar" columns
+        # fallback: if the header contains year-like columns
+        if any(_MAR_RE.search(str(c)) for c in cols) or any(_YEAR_RE.search(str(c)) for c in cols):
+            header_row = header_guess
+            break
+    # else: treat the first row as the header and first column as labels
 
-    if df is None:
-        # final try: read without headers and treat first column as labels
-        df = pd.read_excel(filepath, header=0)
+    # drop fully empty rows
+    df = frame_from_rows(rows, header_row).dropna(how="all")
     df = df.replace(list(NA_VALUES), np.nan)
 
     # Normalize column names to strings
@@ -271,7 +395,7 @@ def load_excel_file(cursor, filepath, company_id, period_ids):
             year_cols.append((c, y))
     if not year_cols:
         logger.warning(f"No year columns detected in {filename}. Skipping.")
-        return
+        return set()
 
     # Build mapping column_label -> fiscal_year (4-digit)
     col_to_year = {col_label: year for col_label, year in year_cols}
@@ -285,80 +409,82 @@ def load_excel_file(cursor, filepath, company_id, period_ids):
     if label_col is None:
         label_col = df.columns[0]
 
-    # Clean numeric columns: remove commas etc (we'll apply clean_numeric per cell)
+    # Clean numeric columns once per column instead of per cell
+    for col_label in col_to_year:
+        try:
+            df[col_label] = clean_numeric_series(df[col_label])
+        except (TypeError, ValueError):
+            # odd dtypes: fall back to the scalar path
+            df[col_label] = df[col_label].map(clean_numeric).astype("float64")
+
     # For each year present in the file, ensure we have a fiscal_period entry
+    # (period_ids is shared across files so each year is upserted once per run)
+    if period_ids is None:
+        period_ids = {}
     fiscal_years_in_file = sorted(set(col_to_year.values()))
     for fy in fiscal_years_in_file:
-        # By default we don't have start/end dates; you may set them externally if desired.
-        get_or_create_fiscal_period(cursor, company_id, fy, fiscal_quarter="FY", period_type="ANNUAL")
-
-    # For each fiscal year column, create a statement entry (one per year)
-    # We'll create statements lazily per year while iterating rows
-    statement_cache = {}  # fiscal_year -> statement_id
-
-    # Walk rows
-    for idx, row in df.iterrows():
-        item_name = str(row.get(label_col, "")).strip()
-        # skip totally blank label rows
-        if item_name == "nan" or item_name == "":
-            continue
-
-        # detect if row is a pure section header (e.g., 'ASSETS', 'CURRENT LIABILITIES')
-        # Build a series of the value columns for this row to check emptiness
-        values_series = row[[c for c in df.columns if c in col_to_year]]
-        if is_section_header(item_name, values_series):
-            # skip header rows
-            continue
-
-        # skip rows where every year value is NaN or non-numeric
-        numeric_present = False
-        prepared_values = {}
-        for col_label, fy in col_to_year.items():
-            raw = row.get(col_label, None)
-            val = clean_numeric(raw)
-            prepared_values[fy] = val
-            if val is not None:
-                numeric_present = True
-        if not numeric_present:
-            # might be an explanatory row or very-high level header; skip
-            continue
-
-        # For each fiscal year where value present, insert fact
-        for fy, val in prepared_values.items():
-            if val is None:
-                continue
-            # get/create statement_id for this fiscal year
-            statement_id = statement_cache.get(fy)
-            if not statement_id:
-                # create statement row for this fiscal year and file/statement_type
-                # we already created fiscal_period entry for fy
-                cursor.execute(
-                    "SELECT period_id FROM fiscal_period WHERE company_id = %s AND fiscal_year = %s AND fiscal_quarter = %s",
-                    (company_id, fy, "FY")
-                )
-                res = cursor.fetchone()
-                if not res:
-                    # unexpected: ensure period created
-                    period_id = get_or_create_fiscal_period(cursor, company_id, fy, fiscal_quarter="FY", period_type="ANNUAL")
-                else:
-                    period_id = res[0]
-                statement_id = create_statement(cursor, period_id, statement_type, currency="INR", units="CRORES")
-                statement_cache[fy] = statement_id
-
-            # build normalized_code and category
-            # include ticker & statement_type to reduce collisions
-            # item_name can be long; slugify_code will clean and upper-case
-            normalized_code = slugify_code("HUL", statement_type, item_name)  # HUL static; will be replaced if company ticker diff
-            # if HUL isn't the ticker, we'll later regenerate; for now ensure uniqueness via DB ON CONFLICT
-            statement_category = categorize_line_item(statement_type, item_name)
-
-            # Insert or get line_item
-            line_item_id = get_or_create_line_item(cursor, item_name, normalized_code, statement_category, description=None)
-
-            # Insert fact
-            insert_financial_fact(cursor, statement_id, line_item_id, val, note=None, source_page=None)
+        if fy not in period_ids:
+            # By default we don't have start/end dates; you may set them externally if desired.
+            period_ids[fy] = get_or_create_fiscal_period(cursor, company_id, fy, fiscal_quarter="FY", period_type="ANNUAL")
+
+    # Facts are collected first, then line items and statements are resolved
+    # in bulk and the facts written with one COPY
+    line_items = {}     # normalized_code -> (name, statement_category)
+
+    # Stack the year columns into one float matrix (NaN = no value); when two
+    # columns map to the same fiscal year the later one wins
+    fy_to_col = {fy: col_label for col_label, fy in col_to_year.items()}
+    fiscal_years = list(fy_to_col)
+    mat = df[list(fy_to_col.values())].to_numpy(dtype="float64")
+    present = ~np.isnan(mat)
+    labels = df[label_col].fillna("").astype(str).str.strip()
+
+    # Rows to load, as one boolean mask: a non-blank label and a value in at
+    # least one year. Rows with no values cover section headers (e.g. 'ASSETS',
+    # 'CURRENT LIABILITIES') and explanatory rows
+    row_mask = present.any(axis=1) & ~labels.isin(["", "nan"]).to_numpy()
+
+    # build normalized_codes for the whole label column in one pass
+    # include ticker & statement_type to reduce collisions
+    # item_name can be long; slugify_codes will clean and upper-case
+    codes = slugify_codes(labels, "HUL", statement_type).to_numpy()  # HUL static; will be replaced if company ticker diff
+    labels = labels.to_numpy()
+
+    row_codes = [None] * len(df)
+    for i in np.flatnonzero(row_mask):
+        item_name = labels[i]
+        normalized_code = codes[i]
+        line_items[normalized_code] = (item_name, categorize_line_item(statement_type, item_name))
+        row_codes[i] = normalized_code
+
+    # One fact per present cell of a labelled row
+    rows_idx, cols_idx = np.nonzero(present)
+    pending_facts = [
+        (fiscal_years[c], row_codes[r], mat[r, c])
+        for r, c in zip(rows_idx.tolist(), cols_idx.tolist())
+        if row_codes[r] is not None
+    ]
+
+    if not pending_facts:
+        logger.info("Loaded file: %s (type=%s, no facts)", filename, statement_type)
+        return set(fiscal_years_in_file)
+
+    line_item_cache = resolve_line_item_ids(cursor, line_items)
+
+    # one statement row per fiscal year present in this file, created in one INSERT
+    statement_cache = create_statements(
+        cursor,
+        {fy: period_ids[fy] for fy in sorted({fy for fy, _, _ in pending_facts})},
+        statement_type, currency="INR", units="CRORES"
+    )  # fiscal_year -> statement_id
+
+    copy_financial_facts(
+        cursor,
+        ((statement_cache[fy], line_item_cache[code], val) for fy, code, val in pending_facts)
+    )
 
     logger.info("Loaded file: %s (type=%s)", filename, statement_type)
+    return set(fiscal_years_in_file)
 
 
 # -------------------------
@@ -393,43 +519,14 @@ def main():
         logger.info("Using company: %s (ticker=%s) -> company_id=%s", company_name, company_ticker, company_id)
         conn.commit()
 
-        # Pre-generate fiscal periods based on union of years across all files
-        fiscal_years = set()
-        for f in files:
-            path = os.path.join(EXCEL_FOLDER, f)
-            # try quick read for columns
-            try:
-                tmp = pd.read_excel(path, nrows=0)
-                cols = [str(c) for c in tmp.columns]
-                for c in cols:
-                    y = parse_year_from_col(c)
-                    if y:
-                        fiscal_years.add(y)
-                # also look deeper if header detection above fails
-                if not any(parse_year_from_col(c) for c in cols):
-                    tmp_all = pd.read_excel(path, header=0)
-                    for c in tmp_all.columns:
-                        y = parse_year_from_col(c)
-                        if y:
-                            fiscal_years.add(y)
-            except Exception:
-                continue
-
-        if not fiscal_years:
-            # fallback: attempt to detect years in each file while loading
-            fiscal_years = None
-        else:
-            for fy in sorted(fiscal_years):
-                get_or_create_fiscal_period(cursor, company_id, fy, fiscal_quarter="FY", period_type="ANNUAL")
-            conn.commit()
-            logger.info("Prepared fiscal periods: %s", sorted(fiscal_years))
-
-        # load each file
+        # load each file; fiscal periods are created as each file's years are seen
+        period_ids = {}  # fiscal_year -> period_id, shared across files
         for f in files:
             path = os.path.join(EXCEL_FOLDER, f)
             logger.info("Processing: %s", f)
-            load_excel_file(cursor, path, company_id, period_ids=None)
+            load_excel_file(cursor, path, company_id, period_ids=period_ids)
             conn.commit()
+        logger.info("Fiscal periods: %s", sorted(period_ids))
 
         logger.info("All files processed successfully.")
     except Exception as e:
@@ -3,10 +3,18 @@ Few-Shot Examples Module
 Contains comprehensive examples for text-to-SQL generation
 """
 
-from .examples import FEW_SHOT_EXAMPLES, SCHEMA_DESCRIPTION, USAGE_NOTES
+from .examples import (
+    FEW_SHOT_EXAMPLES, QUESTIONS, SQL_QUERIES, get_example,
+    sql_for_dialect, validate_examples, SCHEMA_DESCRIPTION, USAGE_NOTES
+)
 
 __all__ = [
     'FEW_SHOT_EXAMPLES',
+    'QUESTIONS',
+    'SQL_QUERIES',
+    'get_example',
+    'sql_for_dialect',
+    'validate_examples',
     'SCHEMA_DESCRIPTION',
     'USAGE_NOTES'
 ]
\ No newline at end of file
@@ -3,29 +3,57 @@ Comprehensive Few-Shot Examples for HUL Financial Data Text-to-SQL
 15 high-impact examples covering various financial analysis patterns
 """
 
-FEW_SHOT_EXAMPLES = [
-    # ====================================================================================
-    # 1. SIMPLE SINGLE-YEAR REVENUE QUERY
-    # ====================================================================================
-    {
-        "question": "What was the total revenue in 2024?",
-        "sql_query": """
+from functools import lru_cache
+from types import MappingProxyType
+
+try:
+    # Optional SQL parser; only needed for validate_examples()/sql_for_dialect()
+    import sqlglot
+except ImportError:
+    sqlglot = None
+
+# ====================================================================================
+# SHARED SQL FRAGMENTS
+# ====================================================================================
+
+# Join chain from a fact to its statement, period and line item
+_FACT_JOINS = """FROM financial_fact ff
+JOIN statement s ON ff.statement_id = s.statement_id
+JOIN fiscal_period fp ON s.period_id = fp.period_id
+JOIN line_item li ON ff.line_item_id = li.line_item_id"""
+
+# The same chain indented for use inside a CTE body
+_CTE_FACT_JOINS = _FACT_JOINS.replace("\n", "\n    ")
+
+# Standard join chain from a fact to its statement, period, line item and company
+_JOIN_BLOCK = _FACT_JOINS + "\nJOIN company c ON fp.company_id = c.company_id"
+
+
+def _single_metric_sql(value_alias, normalized_code, statement_type, fiscal_year, with_units=True):
+    """SQL for one metric in one fiscal year (the simple single-year examples)."""
+    units = """,
+    s.currency,
+    s.units""" if with_units else ""
+    return f"""
 SELECT
     c.name as company_name,
     fp.fiscal_year,
     li.name as metric,
-    ff.value as revenue,
-    s.currency,
-    s.units
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
-WHERE li.normalized_code = 'HUL_PROFIT_LOSS_REVENUE_FROM_OPERATIONS_NET'
-    AND s.statement_type = 'PROFIT_LOSS'
-    AND fp.fiscal_year = 2024;
+    ff.value as {value_alias}{units}
+{_JOIN_BLOCK}
+WHERE li.normalized_code = '{normalized_code}'
+    AND s.statement_type = '{statement_type}'
+    AND fp.fiscal_year = {fiscal_year};
 """
+
+
+_EXAMPLES = [
+    # ====================================================================================
+    # 1. SIMPLE SINGLE-YEAR REVENUE QUERY
+    # ====================================================================================
+    {
+        "question": "What was the total revenue in 2024?",
+        "sql_query": _single_metric_sql("revenue", "HUL_PROFIT_LOSS_REVENUE_FROM_OPERATIONS_NET", "PROFIT_LOSS", 2024)
     },
 
     # ====================================================================================
@@ -33,21 +61,7 @@ WHERE li.normalized_code = 'HUL_PROFIT_LOSS_REVENUE_FROM_OPERATIONS_NET'
     # ====================================================================================
     {
         "question": "What is the net profit margin in 2024?",
-        "sql_query": """
-SELECT
-    c.name as company_name,
-    fp.fiscal_year,
-    li.name as metric,
-    ff.value as net_profit_margin
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
-WHERE li.normalized_code = 'HUL_RATIOS_NET_PROFIT_MARGIN'
-    AND s.statement_type = 'RATIOS'
-    AND fp.fiscal_year = 2024;
-"""
+        "sql_query": _single_metric_sql("net_profit_margin", "HUL_RATIOS_NET_PROFIT_MARGIN", "RATIOS", 2024, with_units=False)
     },
 
     # ====================================================================================
@@ -55,23 +69,7 @@ WHERE li.normalized_code = 'HUL_RATIOS_NET_PROFIT_MARGIN'
     # ====================================================================================
     {
         "question": "What was the operating cash flow in 2024?",
-        "sql_query": """
-SELECT
-    c.name as company_name,
-    fp.fiscal_year,
-    li.name as metric,
-    ff.value as operating_cash_flow,
-    s.currency,
-    s.units
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
-WHERE li.normalized_code = 'HUL_CASH_FLOW_NET_CASH_FROM_OPERATING_ACTIVITIES'
-    AND s.statement_type = 'CASH_FLOW'
-    AND fp.fiscal_year = 2024;
-"""
+        "sql_query": _single_metric_sql("operating_cash_flow", "HUL_CASH_FLOW_NET_CASH_FROM_OPERATING_ACTIVITIES", "CASH_FLOW", 2024)
     },
 
     # ====================================================================================
@@ -79,23 +77,7 @@ WHERE li.normalized_code = 'HUL_CASH_FLOW_NET_CASH_FROM_OPERATING_ACTIVITIES'
     # ====================================================================================
     {
         "question": "What are total assets in 2025?",
-        "sql_query": """
-SELECT
-    c.name as company_name,
-    fp.fiscal_year,
-    li.name as metric,
-    ff.value as total_assets,
-    s.currency,
-    s.units
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
-WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_ASSETS'
-    AND s.statement_type = 'BALANCE'
-    AND fp.fiscal_year = 2025;
-"""
+        "sql_query": _single_metric_sql("total_assets", "HUL_BALANCE_TOTAL_ASSETS", "BALANCE", 2025)
     },
 
     # ====================================================================================
@@ -103,21 +85,17 @@ WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_ASSETS'
     # ====================================================================================
     {
         "question": "Compare revenue between 2023 and 2024",
-        "sql_query": """
+        "sql_query": f"""
 SELECT
     c.name as company_name,
-    MAX(CASE WHEN fp.fiscal_year = 2023 THEN ff.value END) as revenue_2023,
-    MAX(CASE WHEN fp.fiscal_year = 2024 THEN ff.value END) as revenue_2024,
-    MAX(CASE WHEN fp.fiscal_year = 2024 THEN ff.value END) -
-    MAX(CASE WHEN fp.fiscal_year = 2023 THEN ff.value END) as absolute_variance,
-    ROUND(((MAX(CASE WHEN fp.fiscal_year = 2024 THEN ff.value END) -
-            MAX(CASE WHEN fp.fiscal_year = 2023 THEN ff.value END)) /
-            NULLIF(MAX(CASE WHEN fp.fiscal_year = 2023 THEN ff.value END), 0)) * 100, 2) as variance_percentage
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2023) as revenue_2023,
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2024) as revenue_2024,
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2024) -
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2023) as absolute_variance,
+    ROUND(((MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2024) -
+            MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2023)) /
+            NULLIF(MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2023), 0)) * 100, 2) as variance_percentage
+{_JOIN_BLOCK}
 WHERE li.normalized_code = 'HUL_PROFIT_LOSS_REVENUE_FROM_OPERATIONS_NET'
     AND s.statement_type = 'PROFIT_LOSS'
     AND fp.fiscal_year IN (2023, 2024)
@@ -130,7 +108,7 @@ GROUP BY c.name;
     # ====================================================================================
     {
         "question": "Show me the trend of net cash from operating activities over all years",
-        "sql_query": """
+        "sql_query": f"""
 SELECT 
     c.name as company_name,
     fp.fiscal_year,
@@ -138,20 +116,17 @@ SELECT
     ff.value,
     s.currency,
     s.units,
-    LAG(ff.value) OVER (ORDER BY fp.fiscal_year) as previous_year,
-    ff.value - LAG(ff.value) OVER (ORDER BY fp.fiscal_year) as yoy_change,
-    ROUND(((ff.value - LAG(ff.value) OVER (ORDER BY fp.fiscal_year)) / 
-           NULLIF(LAG(ff.value) OVER (ORDER BY fp.fiscal_year), 0)) * 100, 2) as yoy_change_pct,
+    LAG(ff.value) OVER w as previous_year,
+    ff.value - LAG(ff.value) OVER w as yoy_change,
+    ROUND(((ff.value - LAG(ff.value) OVER w) / 
+           NULLIF(LAG(ff.value) OVER w, 0)) * 100, 2) as yoy_change_pct,
     ROUND(AVG(ff.value) OVER (), 2) as avg_across_all_years,
-    ROUND(((ff.value - FIRST_VALUE(ff.value) OVER (ORDER BY fp.fiscal_year)) / 
-           NULLIF(FIRST_VALUE(ff.value) OVER (ORDER BY fp.fiscal_year), 0)) * 100, 2) as cumulative_growth_from_2021
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+    ROUND(((ff.value - FIRST_VALUE(ff.value) OVER w) / 
+           NULLIF(FIRST_VALUE(ff.value) OVER w, 0)) * 100, 2) as cumulative_growth_from_2021
+{_JOIN_BLOCK}
 WHERE li.normalized_code = 'HUL_CASH_FLOW_NET_CASH_FROM_OPERATING_ACTIVITIES'
     AND s.statement_type = 'CASH_FLOW'
+WINDOW w AS (ORDER BY fp.fiscal_year)
 ORDER BY fp.fiscal_year;
 """
     },
@@ -161,24 +136,20 @@ ORDER BY fp.fiscal_year;
     # ====================================================================================
     {
         "question": "Compare the current ratio across all years",
-        "sql_query": """
+        "sql_query": f"""
 SELECT 
     c.name as company_name,
     li.name as ratio_name,
-    MAX(CASE WHEN fp.fiscal_year = 2021 THEN ff.value END) as year_2021,
-    MAX(CASE WHEN fp.fiscal_year = 2022 THEN ff.value END) as year_2022,
-    MAX(CASE WHEN fp.fiscal_year = 2023 THEN ff.value END) as year_2023,
-    MAX(CASE WHEN fp.fiscal_year = 2024 THEN ff.value END) as year_2024,
-    MAX(CASE WHEN fp.fiscal_year = 2025 THEN ff.value END) as year_2025,
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2021) as year_2021,
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2022) as year_2022,
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2023) as year_2023,
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2024) as year_2024,
+    MAX(ff.value) FILTER (WHERE fp.fiscal_year = 2025) as year_2025,
     ROUND(AVG(ff.value), 2) as avg_ratio,
     ROUND(MIN(ff.value), 2) as min_ratio,
     ROUND(MAX(ff.value), 2) as max_ratio,
     ROUND(STDDEV(ff.value), 3) as volatility
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+{_JOIN_BLOCK}
 WHERE li.normalized_code = 'HUL_RATIOS_CURRENT_RATIO'
     AND s.statement_type = 'RATIOS'
 GROUP BY c.name, li.name;
@@ -190,27 +161,24 @@ GROUP BY c.name, li.name;
     # ====================================================================================
     {
         "question": "What is the profit margin trend over the years?",
-        "sql_query": """
+        "sql_query": f"""
 SELECT 
     c.name as company_name,
     fp.fiscal_year,
     li.name as metric,
     ff.value as net_profit_margin,
-    LAG(ff.value, 1) OVER (ORDER BY fp.fiscal_year) as prev_year_margin,
-    ff.value - LAG(ff.value, 1) OVER (ORDER BY fp.fiscal_year) as margin_change_bps,
+    LAG(ff.value, 1) OVER w as prev_year_margin,
+    ff.value - LAG(ff.value, 1) OVER w as margin_change_bps,
     ROUND(AVG(ff.value) OVER (), 2) as avg_margin_all_years,
     CASE 
         WHEN ff.value > AVG(ff.value) OVER () THEN 'Above Average'
         WHEN ff.value < AVG(ff.value) OVER () THEN 'Below Average'
         ELSE 'At Average'
     END as performance_vs_avg
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+{_JOIN_BLOCK}
 WHERE li.normalized_code = 'HUL_RATIOS_NET_PROFIT_MARGIN'
     AND s.statement_type = 'RATIOS'
+WINDOW w AS (ORDER BY fp.fiscal_year)
 ORDER BY fp.fiscal_year;
 """
     },
@@ -220,27 +188,24 @@ ORDER BY fp.fiscal_year;
     # ====================================================================================
     {
         "question": "How has total assets grown year over year?",
-        "sql_query": """
+        "sql_query": f"""
 SELECT 
     c.name as company_name,
     fp.fiscal_year,
     li.name as metric,
     ff.value as total_assets,
     s.units,
-    LAG(ff.value, 1) OVER (ORDER BY fp.fiscal_year) as prev_year_assets,
-    ff.value - LAG(ff.value, 1) OVER (ORDER BY fp.fiscal_year) as yoy_growth,
-    ROUND(((ff.value - LAG(ff.value, 1) OVER (ORDER BY fp.fiscal_year)) / 
-           NULLIF(LAG(ff.value, 1) OVER (ORDER BY fp.fiscal_year), 0)) * 100, 2) as yoy_growth_pct,
-    ROUND(((ff.value - FIRST_VALUE(ff.value) OVER (ORDER BY fp.fiscal_year)) / 
-           NULLIF(FIRST_VALUE(ff.value) OVER (ORDER BY fp.fiscal_year), 0)) * 100, 2) as cumulative_growth_from_2021,
-    ROUND((ff.value / NULLIF(FIRST_VALUE(ff.value) OVER (ORDER BY fp.fiscal_year), 0)), 2) as growth_multiple
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+    LAG(ff.value, 1) OVER w as prev_year_assets,
+    ff.value - LAG(ff.value, 1) OVER w as yoy_growth,
+    ROUND(((ff.value - LAG(ff.value, 1) OVER w) / 
+           NULLIF(LAG(ff.value, 1) OVER w, 0)) * 100, 2) as yoy_growth_pct,
+    ROUND(((ff.value - FIRST_VALUE(ff.value) OVER w) / 
+           NULLIF(FIRST_VALUE(ff.value) OVER w, 0)) * 100, 2) as cumulative_growth_from_2021,
+    ROUND((ff.value / NULLIF(FIRST_VALUE(ff.value) OVER w, 0)), 2) as growth_multiple
+{_JOIN_BLOCK}
 WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_ASSETS'
     AND s.statement_type = 'BALANCE'
+WINDOW w AS (ORDER BY fp.fiscal_year)
 ORDER BY fp.fiscal_year;
 """
     },
@@ -250,39 +215,28 @@ ORDER BY fp.fiscal_year;
     # ====================================================================================
     {
         "question": "Compare debt equity ratio with return on net worth",
-        "sql_query": """
-WITH debt_equity AS (
+        "sql_query": f"""
+WITH leverage AS (
     SELECT 
         fp.fiscal_year,
-        ff.value as debt_equity_ratio
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_RATIOS_DEBT_EQUITY_RATIO'
-        AND s.statement_type = 'RATIOS'
-),
-return_metrics AS (
-    SELECT 
-        fp.fiscal_year,
-        ff.value as return_on_net_worth
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_RATIOS_RETURN_ON_NET_WORTH'
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_RATIOS_DEBT_EQUITY_RATIO') as debt_equity_ratio,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_RATIOS_RETURN_ON_NET_WORTH') as return_on_net_worth
+    {_CTE_FACT_JOINS}
+    WHERE li.normalized_code IN ('HUL_RATIOS_DEBT_EQUITY_RATIO', 'HUL_RATIOS_RETURN_ON_NET_WORTH')
         AND s.statement_type = 'RATIOS'
+    GROUP BY fp.fiscal_year
+    HAVING COUNT(DISTINCT li.normalized_code) = 2
 )
 SELECT 
-    de.fiscal_year,
-    ROUND(de.debt_equity_ratio, 3) as debt_equity_ratio,
-    ROUND(rm.return_on_net_worth, 2) as return_on_net_worth_pct,
-    ROUND(de.debt_equity_ratio * rm.return_on_net_worth, 2) as leverage_adjusted_return,
-    LAG(de.debt_equity_ratio) OVER (ORDER BY de.fiscal_year) as prev_year_de_ratio,
-    LAG(rm.return_on_net_worth) OVER (ORDER BY de.fiscal_year) as prev_year_ronw
-FROM debt_equity de
-JOIN return_metrics rm ON de.fiscal_year = rm.fiscal_year
-ORDER BY de.fiscal_year;
+    fiscal_year,
+    ROUND(debt_equity_ratio, 3) as debt_equity_ratio,
+    ROUND(return_on_net_worth, 2) as return_on_net_worth_pct,
+    ROUND(debt_equity_ratio * return_on_net_worth, 2) as leverage_adjusted_return,
+    LAG(debt_equity_ratio) OVER w as prev_year_de_ratio,
+    LAG(return_on_net_worth) OVER w as prev_year_ronw
+FROM leverage
+WINDOW w AS (ORDER BY fiscal_year)
+ORDER BY fiscal_year;
 """
     },
     
@@ -291,44 +245,33 @@ ORDER BY de.fiscal_year;
     # ====================================================================================
     {
         "question": "Analyze working capital efficiency over time",
-        "sql_query": """
-WITH current_assets AS (
-    SELECT 
-        fp.fiscal_year,
-        ff.value as current_assets
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_ASSETS'
-        AND s.statement_type = 'BALANCE'
-),
-current_liabilities AS (
-    SELECT 
+        "sql_query": f"""
+WITH working_capital AS (
+    SELECT
         fp.fiscal_year,
-        ff.value as current_liabilities
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_LIABILITIES'
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_ASSETS') as current_assets,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_LIABILITIES') as current_liabilities
+    {_CTE_FACT_JOINS}
+    WHERE li.normalized_code IN ('HUL_BALANCE_TOTAL_CURRENT_ASSETS', 'HUL_BALANCE_TOTAL_CURRENT_LIABILITIES')
         AND s.statement_type = 'BALANCE'
+    GROUP BY fp.fiscal_year
+    HAVING COUNT(DISTINCT li.normalized_code) = 2
 )
 SELECT 
-    ca.fiscal_year,
-    ca.current_assets,
-    cl.current_liabilities,
-    ca.current_assets - cl.current_liabilities as working_capital,
-    ROUND((ca.current_assets / NULLIF(cl.current_liabilities, 0)), 2) as current_ratio,
-    LAG(ca.current_assets - cl.current_liabilities) OVER (ORDER BY ca.fiscal_year) as prev_year_wc,
-    (ca.current_assets - cl.current_liabilities) - 
-    LAG(ca.current_assets - cl.current_liabilities) OVER (ORDER BY ca.fiscal_year) as wc_change,
-    ROUND((((ca.current_assets - cl.current_liabilities) - 
-            LAG(ca.current_assets - cl.current_liabilities) OVER (ORDER BY ca.fiscal_year)) / 
-            NULLIF(LAG(ca.current_assets - cl.current_liabilities) OVER (ORDER BY ca.fiscal_year), 0)) * 100, 2) as wc_growth_pct
-FROM current_assets ca
-JOIN current_liabilities cl ON ca.fiscal_year = cl.fiscal_year
-ORDER BY ca.fiscal_year;
+    fiscal_year,
+    current_assets,
+    current_liabilities,
+    current_assets - current_liabilities as working_capital,
+    ROUND((current_assets / NULLIF(current_liabilities, 0)), 2) as current_ratio,
+    LAG(current_assets - current_liabilities) OVER w as prev_year_wc,
+    (current_assets - current_liabilities) - 
+    LAG(current_assets - current_liabilities) OVER w as wc_change,
+    ROUND((((current_assets - current_liabilities) - 
+            LAG(current_assets - current_liabilities) OVER w) / 
+            NULLIF(LAG(current_assets - current_liabilities) OVER w, 0)) * 100, 2) as wc_growth_pct
+FROM working_capital
+WINDOW w AS (ORDER BY fiscal_year)
+ORDER BY fiscal_year;
 """
     },
     
@@ -337,20 +280,16 @@ ORDER BY ca.fiscal_year;
     # ====================================================================================
     {
         "question": "What are the key profitability metrics for 2024?",
-        "sql_query": """
+        "sql_query": f"""
 SELECT 
     c.name as company_name,
     fp.fiscal_year,
     li.name as metric,
     ff.value as ratio_value,
-    ROUND(AVG(ff.value) OVER (PARTITION BY li.line_item_id), 2) as avg_across_years,
-    ROUND(ff.value - AVG(ff.value) OVER (PARTITION BY li.line_item_id), 2) as variance_from_avg,
-    RANK() OVER (PARTITION BY li.line_item_id ORDER BY ff.value DESC) as year_rank
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN company c ON fp.company_id = c.company_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+    ROUND(AVG(ff.value) OVER item, 2) as avg_across_years,
+    ROUND(ff.value - AVG(ff.value) OVER item, 2) as variance_from_avg,
+    RANK() OVER (item ORDER BY ff.value DESC) as year_rank
+{_JOIN_BLOCK}
 WHERE li.normalized_code IN (
         'HUL_RATIOS_NET_PROFIT_MARGIN',
         'HUL_RATIOS_OPERATING_PROFIT_MARGIN',
@@ -360,6 +299,7 @@ WHERE li.normalized_code IN (
     )
     AND s.statement_type = 'RATIOS'
     AND fp.fiscal_year = 2024
+WINDOW item AS (PARTITION BY li.line_item_id)
 ORDER BY li.name;
 """
     },
@@ -369,37 +309,25 @@ ORDER BY li.name;
     # ====================================================================================
     {
         "question": "Calculate working capital for each year",
-        "sql_query": """
-WITH current_assets AS (
-    SELECT
-        fp.fiscal_year,
-        ff.value as current_assets
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_ASSETS'
-        AND s.statement_type = 'BALANCE'
-),
-current_liabilities AS (
+        "sql_query": f"""
+WITH working_capital AS (
     SELECT
         fp.fiscal_year,
-        ff.value as current_liabilities
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_LIABILITIES'
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_ASSETS') as current_assets,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_CURRENT_LIABILITIES') as current_liabilities
+    {_CTE_FACT_JOINS}
+    WHERE li.normalized_code IN ('HUL_BALANCE_TOTAL_CURRENT_ASSETS', 'HUL_BALANCE_TOTAL_CURRENT_LIABILITIES')
         AND s.statement_type = 'BALANCE'
+    GROUP BY fp.fiscal_year
+    HAVING COUNT(DISTINCT li.normalized_code) = 2
 )
 SELECT
-    ca.fiscal_year,
-    ca.current_assets,
-    cl.current_liabilities,
-    ca.current_assets - cl.current_liabilities as working_capital
-FROM current_assets ca
-JOIN current_liabilities cl ON ca.fiscal_year = cl.fiscal_year
-ORDER BY ca.fiscal_year;
+    fiscal_year,
+    current_assets,
+    current_liabilities,
+    current_assets - current_liabilities as working_capital
+FROM working_capital
+ORDER BY fiscal_year;
 """
     },
     
@@ -408,47 +336,35 @@ ORDER BY ca.fiscal_year;
     # ====================================================================================
     {
         "question": "Break down cash flow from operating, investing and financing activities",
-        "sql_query": """
-WITH operating_cf AS (
-    SELECT fp.fiscal_year, ff.value as operating_cf
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_CASH_FLOW_NET_CASH_FROM_OPERATING_ACTIVITIES'
-        AND s.statement_type = 'CASH_FLOW'
-),
-investing_cf AS (
-    SELECT fp.fiscal_year, ff.value as investing_cf
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_CASH_FLOW_INVESTING_ACTIVITIES'
-        AND s.statement_type = 'CASH_FLOW'
-),
-financing_cf AS (
-    SELECT fp.fiscal_year, ff.value as financing_cf
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_CASH_FLOW_NET_CASH_USED_IN_FROM_FINANCING_ACTIVITIES'
+        "sql_query": f"""
+WITH cash_flows AS (
+    SELECT
+        fp.fiscal_year,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_CASH_FLOW_NET_CASH_FROM_OPERATING_ACTIVITIES') as operating_cf,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_CASH_FLOW_INVESTING_ACTIVITIES') as investing_cf,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_CASH_FLOW_NET_CASH_USED_IN_FROM_FINANCING_ACTIVITIES') as financing_cf
+    {_CTE_FACT_JOINS}
+    WHERE li.normalized_code IN (
+            'HUL_CASH_FLOW_NET_CASH_FROM_OPERATING_ACTIVITIES',
+            'HUL_CASH_FLOW_INVESTING_ACTIVITIES',
+            'HUL_CASH_FLOW_NET_CASH_USED_IN_FROM_FINANCING_ACTIVITIES'
+        )
         AND s.statement_type = 'CASH_FLOW'
+    GROUP BY fp.fiscal_year
+    HAVING COUNT(DISTINCT li.normalized_code) = 3
 )
 SELECT 
-    o.fiscal_year,
-    o.operating_cf,
-    i.investing_cf,
-    f.financing_cf,
-    o.operating_cf + i.investing_cf + f.financing_cf as net_cash_change,
-    ROUND((o.operating_cf / NULLIF(ABS(i.investing_cf) + ABS(f.financing_cf), 0)), 2) as cf_coverage_ratio,
-    LAG(o.operating_cf) OVER (ORDER BY o.fiscal_year) as prev_operating_cf,
-    o.operating_cf - LAG(o.operating_cf) OVER (ORDER BY o.fiscal_year) as operating_cf_change
-FROM operating_cf o
-JOIN investing_cf i ON o.fiscal_year = i.fiscal_year
-JOIN financing_cf f ON o.fiscal_year = f.fiscal_year
-ORDER BY o.fiscal_year;
+    fiscal_year,
+    operating_cf,
+    investing_cf,
+    financing_cf,
+    operating_cf + investing_cf + financing_cf as net_cash_change,
+    ROUND((operating_cf / NULLIF(ABS(investing_cf) + ABS(financing_cf), 0)), 2) as cf_coverage_ratio,
+    LAG(operating_cf) OVER w as prev_operating_cf,
+    operating_cf - LAG(operating_cf) OVER w as operating_cf_change
+FROM cash_flows
+WINDOW w AS (ORDER BY fiscal_year)
+ORDER BY fiscal_year;
 """
     },
     
@@ -457,14 +373,14 @@ ORDER BY o.fiscal_year;
     # ====================================================================================
     {
         "question": "Show me all liquidity ratios and their trends",
-        "sql_query": """
+        "sql_query": f"""
 SELECT 
     fp.fiscal_year,
     li.name as liquidity_metric,
     ff.value as ratio_value,
-    LAG(ff.value) OVER (PARTITION BY li.line_item_id ORDER BY fp.fiscal_year) as prev_year,
-    ff.value - LAG(ff.value) OVER (PARTITION BY li.line_item_id ORDER BY fp.fiscal_year) as change,
-    ROUND(AVG(ff.value) OVER (PARTITION BY li.line_item_id), 3) as avg_ratio,
+    LAG(ff.value) OVER w as prev_year,
+    ff.value - LAG(ff.value) OVER w as change,
+    ROUND(AVG(ff.value) OVER item, 3) as avg_ratio,
     CASE 
         WHEN li.normalized_code = 'HUL_RATIOS_CURRENT_RATIO' AND ff.value >= 2.0 THEN 'Healthy'
         WHEN li.normalized_code = 'HUL_RATIOS_CURRENT_RATIO' AND ff.value >= 1.5 THEN 'Adequate'
@@ -473,15 +389,14 @@ SELECT
         WHEN li.normalized_code = 'HUL_RATIOS_QUICK_RATIO' AND ff.value < 1.0 THEN 'Weak'
         ELSE 'Review'
     END as health_indicator
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+{_FACT_JOINS}
 WHERE li.normalized_code IN (
         'HUL_RATIOS_CURRENT_RATIO',
         'HUL_RATIOS_QUICK_RATIO'
     )
     AND s.statement_type = 'RATIOS'
+WINDOW item AS (PARTITION BY li.line_item_id),
+       w AS (item ORDER BY fp.fiscal_year)
 ORDER BY li.name, fp.fiscal_year;
 """
     },
@@ -491,24 +406,23 @@ ORDER BY li.name, fp.fiscal_year;
     # ====================================================================================
     {
         "question": "Analyze inventory turnover and receivables efficiency",
-        "sql_query": """
+        "sql_query": f"""
 SELECT 
     fp.fiscal_year,
     li.name as efficiency_metric,
     ff.value as turnover_ratio,
     ROUND(365.0 / NULLIF(ff.value, 0), 1) as days,
-    LAG(ff.value) OVER (PARTITION BY li.line_item_id ORDER BY fp.fiscal_year) as prev_year_ratio,
-    ROUND(ff.value - LAG(ff.value) OVER (PARTITION BY li.line_item_id ORDER BY fp.fiscal_year), 2) as ratio_change,
-    ROUND(AVG(ff.value) OVER (PARTITION BY li.line_item_id), 2) as avg_turnover
-FROM financial_fact ff
-JOIN statement s ON ff.statement_id = s.statement_id
-JOIN fiscal_period fp ON s.period_id = fp.period_id
-JOIN line_item li ON ff.line_item_id = li.line_item_id
+    LAG(ff.value) OVER w as prev_year_ratio,
+    ROUND(ff.value - LAG(ff.value) OVER w, 2) as ratio_change,
+    ROUND(AVG(ff.value) OVER item, 2) as avg_turnover
+{_FACT_JOINS}
 WHERE li.normalized_code IN (
         'HUL_RATIOS_INVENTORY_TURNOVER_RATIO',
         'HUL_RATIOS_DEBTORS_TURNOVER_RATIO'
     )
     AND s.statement_type = 'RATIOS'
+WINDOW item AS (PARTITION BY li.line_item_id),
+       w AS (item ORDER BY fp.fiscal_year)
 ORDER BY li.name, fp.fiscal_year;
 """
     },
@@ -518,48 +432,40 @@ ORDER BY li.name, fp.fiscal_year;
     # ====================================================================================
     {
         "question": "What is the composition of total assets across categories?",
-        "sql_query": """
-WITH asset_data AS (
+        "sql_query": f"""
+WITH balance_data AS (
     SELECT 
         fp.fiscal_year,
         li.name as asset_category,
         ff.value as asset_value,
-        li.normalized_code
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.statement_category = 'ASSET'
-        AND s.statement_type = 'BALANCE'
+        li.normalized_code,
+        li.statement_category,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_ASSETS')
+            OVER (PARTITION BY fp.fiscal_year) as total_assets
+    {_CTE_FACT_JOINS}
+    WHERE s.statement_type = 'BALANCE'
         AND li.normalized_code IN (
             'HUL_BALANCE_TOTAL_NON_CURRENT_ASSETS',
             'HUL_BALANCE_TOTAL_CURRENT_ASSETS',
             'HUL_BALANCE_TANGIBLE_ASSETS',
-            'HUL_BALANCE_INTANGIBLE_ASSETS'
+            'HUL_BALANCE_INTANGIBLE_ASSETS',
+            'HUL_BALANCE_TOTAL_ASSETS'
         )
-),
-total_assets AS (
-    SELECT 
-        fp.fiscal_year,
-        ff.value as total_assets
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_BALANCE_TOTAL_ASSETS'
-        AND s.statement_type = 'BALANCE'
 )
 SELECT 
     ad.fiscal_year,
     ad.asset_category,
     ad.asset_value,
-    ta.total_assets,
-    ROUND((ad.asset_value / NULLIF(ta.total_assets, 0)) * 100, 2) as pct_of_total_assets,
-    LAG(ad.asset_value) OVER (PARTITION BY ad.normalized_code ORDER BY ad.fiscal_year) as prev_year_value,
-    ROUND(((ad.asset_value - LAG(ad.asset_value) OVER (PARTITION BY ad.normalized_code ORDER BY ad.fiscal_year)) / 
-           NULLIF(LAG(ad.asset_value) OVER (PARTITION BY ad.normalized_code ORDER BY ad.fiscal_year), 0)) * 100, 2) as yoy_growth_pct
-FROM asset_data ad
-JOIN total_assets ta ON ad.fiscal_year = ta.fiscal_year
+    ad.total_assets,
+    ROUND((ad.asset_value / NULLIF(ad.total_assets, 0)) * 100, 2) as pct_of_total_assets,
+    LAG(ad.asset_value) OVER w as prev_year_value,
+    ROUND(((ad.asset_value - LAG(ad.asset_value) OVER w) / 
+           NULLIF(LAG(ad.asset_value) OVER w, 0)) * 100, 2) as yoy_growth_pct
+FROM balance_data ad
+WHERE ad.normalized_code <> 'HUL_BALANCE_TOTAL_ASSETS'
+    AND ad.statement_category = 'ASSET'
+    AND ad.total_assets IS NOT NULL
+WINDOW w AS (PARTITION BY ad.normalized_code ORDER BY ad.fiscal_year)
 ORDER BY ad.fiscal_year, ad.asset_value DESC;
 """
     },
@@ -569,41 +475,32 @@ ORDER BY ad.fiscal_year, ad.asset_value DESC;
     # ====================================================================================
     {
         "question": "Show earnings per share and dividend trends",
-        "sql_query": """
-WITH eps_data AS (
-    SELECT 
-        fp.fiscal_year,
-        ff.value as basic_eps
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_PROFIT_LOSS_BASIC_EPS_RS'
-        AND s.statement_type = 'PROFIT_LOSS'
-),
-dividend_data AS (
+        "sql_query": f"""
+WITH per_share AS (
     SELECT 
         fp.fiscal_year,
-        ff.value as dividend_per_share
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE li.normalized_code = 'HUL_RATIOS_DIVIDEND_PER_SHARE'
-        AND s.statement_type = 'RATIOS'
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_PROFIT_LOSS_BASIC_EPS_RS'
+                                AND s.statement_type = 'PROFIT_LOSS') as basic_eps,
+        MAX(ff.value) FILTER (WHERE li.normalized_code = 'HUL_RATIOS_DIVIDEND_PER_SHARE'
+                                AND s.statement_type = 'RATIOS') as dividend_per_share
+    {_CTE_FACT_JOINS}
+    WHERE (li.normalized_code = 'HUL_PROFIT_LOSS_BASIC_EPS_RS' AND s.statement_type = 'PROFIT_LOSS')
+        OR (li.normalized_code = 'HUL_RATIOS_DIVIDEND_PER_SHARE' AND s.statement_type = 'RATIOS')
+    GROUP BY fp.fiscal_year
+    HAVING COUNT(DISTINCT li.normalized_code) = 2
 )
 SELECT 
-    e.fiscal_year,
-    e.basic_eps,
-    d.dividend_per_share,
-    ROUND((d.dividend_per_share / NULLIF(e.basic_eps, 0)) * 100, 2) as dividend_payout_ratio,
-    LAG(e.basic_eps) OVER (ORDER BY e.fiscal_year) as prev_year_eps,
-    ROUND(((e.basic_eps - LAG(e.basic_eps) OVER (ORDER BY e.fiscal_year)) / 
-           NULLIF(LAG(e.basic_eps) OVER (ORDER BY e.fiscal_year), 0)) * 100, 2) as eps_growth_pct,
-    e.basic_eps - d.dividend_per_share as retained_earnings_per_share
-FROM eps_data e
-JOIN dividend_data d ON e.fiscal_year = d.fiscal_year
-ORDER BY e.fiscal_year;
+    fiscal_year,
+    basic_eps,
+    dividend_per_share,
+    ROUND((dividend_per_share / NULLIF(basic_eps, 0)) * 100, 2) as dividend_payout_ratio,
+    LAG(basic_eps) OVER w as prev_year_eps,
+    ROUND(((basic_eps - LAG(basic_eps) OVER w) / 
+           NULLIF(LAG(basic_eps) OVER w, 0)) * 100, 2) as eps_growth_pct,
+    basic_eps - dividend_per_share as retained_earnings_per_share
+FROM per_share
+WINDOW w AS (ORDER BY fiscal_year)
+ORDER BY fiscal_year;
 """
     },
     
@@ -612,23 +509,16 @@ ORDER BY e.fiscal_year;
     # ====================================================================================
     {
         "question": "Give me a comprehensive financial health scorecard for the latest year",
-        "sql_query": """
-WITH latest_year AS (
-    SELECT MAX(fiscal_year) as max_year FROM fiscal_period
-),
-metrics AS (
+        "sql_query": f"""
+WITH history AS (
     SELECT 
         fp.fiscal_year,
         li.normalized_code,
         li.name,
         ff.value,
-        li.statement_category
-    FROM financial_fact ff
-    JOIN statement s ON ff.statement_id = s.statement_id
-    JOIN fiscal_period fp ON s.period_id = fp.period_id
-    JOIN line_item li ON ff.line_item_id = li.line_item_id
-    WHERE fp.fiscal_year = (SELECT max_year FROM latest_year)
-        AND li.normalized_code IN (
+        AVG(ff.value) OVER (PARTITION BY li.normalized_code) as historical_avg
+    {_CTE_FACT_JOINS}
+    WHERE li.normalized_code IN (
             'HUL_RATIOS_NET_PROFIT_MARGIN',
             'HUL_RATIOS_RETURN_ON_NET_WORTH',
             'HUL_RATIOS_CURRENT_RATIO',
@@ -638,31 +528,73 @@ metrics AS (
         )
 )
 SELECT 
-    m.fiscal_year,
-    m.name as metric,
-    m.value as current_value,
-    ROUND(AVG(ff_hist.value), 2) as historical_avg,
-    ROUND(m.value - AVG(ff_hist.value), 2) as variance_from_avg,
+    h.fiscal_year,
+    h.name as metric,
+    h.value as current_value,
+    ROUND(h.historical_avg, 2) as historical_avg,
+    ROUND(h.value - h.historical_avg, 2) as variance_from_avg,
     CASE 
-        WHEN m.normalized_code LIKE '%MARGIN%' AND m.value > AVG(ff_hist.value) THEN 'Strong'
-        WHEN m.normalized_code LIKE '%RETURN%' AND m.value > AVG(ff_hist.value) THEN 'Strong'
-        WHEN m.normalized_code LIKE '%CURRENT_RATIO%' AND m.value >= 1.5 THEN 'Healthy'
-        WHEN m.normalized_code LIKE '%DEBT_EQUITY%' AND m.value < 0.5 THEN 'Low Risk'
-        WHEN m.normalized_code LIKE '%TURNOVER%' AND m.value > AVG(ff_hist.value) THEN 'Efficient'
+        WHEN h.normalized_code LIKE '%MARGIN%' AND h.value > h.historical_avg THEN 'Strong'
+        WHEN h.normalized_code LIKE '%RETURN%' AND h.value > h.historical_avg THEN 'Strong'
+        WHEN h.normalized_code LIKE '%CURRENT_RATIO%' AND h.value >= 1.5 THEN 'Healthy'
+        WHEN h.normalized_code LIKE '%DEBT_EQUITY%' AND h.value < 0.5 THEN 'Low Risk'
+        WHEN h.normalized_code LIKE '%TURNOVER%' AND h.value > h.historical_avg THEN 'Efficient'
         ELSE 'Review'
     END as assessment
-FROM metrics m
-LEFT JOIN financial_fact ff_hist ON ff_hist.line_item_id = (
-    SELECT line_item_id FROM line_item WHERE normalized_code = m.normalized_code
-)
-LEFT JOIN statement s_hist ON ff_hist.statement_id = s_hist.statement_id
-LEFT JOIN fiscal_period fp_hist ON s_hist.period_id = fp_hist.period_id
-GROUP BY m.fiscal_year, m.name, m.value, m.normalized_code
-ORDER BY m.name;
+FROM history h
+WHERE h.fiscal_year = (SELECT MAX(fiscal_year) FROM fiscal_period)
+ORDER BY h.name;
 """
     }
 ]
 
+# Column views of the examples for code that only needs one field
+# (embedding the questions, seeding caches) - built once at import. The
+# newlines around each query are trimmed here so neither the prompt formatter
+# nor SQL served from the cache has to strip it per request.
+QUESTIONS = tuple(ex["question"] for ex in _EXAMPLES)
+SQL_QUERIES = tuple(ex["sql_query"].strip() for ex in _EXAMPLES)
+del _EXAMPLES
+
+# Read-only: callers that need to change the set (experiments) build their own
+FEW_SHOT_EXAMPLES = tuple(
+    MappingProxyType({"question": q, "sql_query": s}) for q, s in zip(QUESTIONS, SQL_QUERIES)
+)
+
+
+def get_example(i):
+    """Return (question, sql_query) for example i."""
+    return QUESTIONS[i], SQL_QUERIES[i]
+
+
+@lru_cache(maxsize=None)
+def _example_ast(i):
+    """Parsed (PostgreSQL) syntax tree of example i, parsed on first use."""
+    if sqlglot is None:
+        raise ImportError("sqlglot is required to parse the example SQL (pip install sqlglot)")
+    return sqlglot.parse_one(SQL_QUERIES[i], read="postgres")
+
+
+@lru_cache(maxsize=None)
+def sql_for_dialect(i, dialect):
+    """SQL of example i rendered for another sqlglot dialect (e.g. 'sqlite', 'mysql')."""
+    return _example_ast(i).sql(dialect=dialect, pretty=True)
+
+
+def validate_examples():
+    """
+    Parse every example's SQL, raising ValueError naming the first example that fails.
+
+    Parsed trees are cached, so sql_for_dialect() reuses them afterwards.
+    """
+    if sqlglot is None:
+        raise ImportError("sqlglot is required to parse the example SQL (pip install sqlglot)")
+    for i, question in enumerate(QUESTIONS):
+        try:
+            _example_ast(i)
+        except (sqlglot.errors.ParseError, sqlglot.errors.TokenError) as e:
+            raise ValueError(f"Example {i} ({question!r}) has invalid SQL: {e}") from e
+
 # ====================================================================================
 # SCHEMA CONTEXT FOR REFERENCE
 # ====================================================================================
@@ -777,13 +709,15 @@ These 17 examples cover:
 
 Pattern Coverage:
 - Simple SELECT with JOINs
-- CASE pivots for year comparisons
+- Aggregate FILTER pivots for year comparisons (MAX(ff.value) FILTER (WHERE fp.fiscal_year = N)),
+  preferred over MAX(CASE WHEN ...) since PostgreSQL evaluates them as plain filtered aggregates
 - Window functions (LAG, LEAD, FIRST_VALUE, AVG OVER, RANK)
 - CTEs for complex analysis
 - Statistical aggregations
 - Percentage calculations
 - Conditional logic (CASE for assessments)
-- Multi-table CTEs for derived metrics
+- Single pivoting CTE per statement for derived metrics (one scan, not one CTE per metric)
+- Named WINDOW clauses (WINDOW w AS (...), OVER w) when several window functions share a spec
 - Composition analysis (% of total)
 - Trend analysis (YoY, cumulative)
 
@@ -791,4 +725,9 @@ Import this in your main agent:
 ```python
 from examples import FEW_SHOT_EXAMPLES, SCHEMA_DESCRIPTION
 ```
-"""
\ No newline at end of file
+"""
+
+
+if __name__ == "__main__":
+    validate_examples()
+    print(f"All {len(SQL_QUERIES)} example queries parse as PostgreSQL")
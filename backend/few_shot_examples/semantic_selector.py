@@ -3,22 +3,135 @@ Semantic Example Selector for Few-Shot Learning
 Uses sentence embeddings to select the most relevant examples for a given question
 """
 
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import numpy as np
-from typing import List, Dict
-from sentence_transformers import SentenceTransformer
+from cachetools import LRUCache
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Example embeddings are cached here, keyed by model name + example questions
+EMBEDDING_CACHE_DIR = Path(__file__).parent / ".embedding_cache"
+
+
+def _embedding_cache_path(questions: List[str], model_name: str) -> Path:
+    """Cache file for a (model, questions) pair; changes whenever either changes."""
+    digest = hashlib.sha1(model_name.encode("utf-8"))
+    for q in questions:
+        digest.update(b"\0" + q.encode("utf-8"))
+    return EMBEDDING_CACHE_DIR / f"{digest.hexdigest()[:16]}.npy"
+
+
+# int8 ONNX export (AVX-512 VNNI kernels) shipped in the sentence-transformers model repos
+ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+
+# PyTorch otherwise starts one intra-op thread per core, which competes with the
+# API's worker processes/threads; tune to roughly cores / workers
+SELECTOR_THREADS = int(os.getenv("SELECTOR_THREADS", "2"))
+_torch_threads_set = False
+
+
+def _limit_torch_threads():
+    """Cap PyTorch's CPU thread pools to SELECTOR_THREADS (once per process)."""
+    global _torch_threads_set
+    if _torch_threads_set:
+        return
+    import torch
+    torch.set_num_threads(SELECTOR_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before torch runs any parallel work; keep its setting if it has
+        pass
+    _torch_threads_set = True
+
+
+@lru_cache(maxsize=None)
+def _load_model(model_name: str, backend: str):
+    """
+    Load the encoder, returning (model, backend actually used).
+
+    backend='onnx' runs the int8-quantized ONNX export through ONNX Runtime, which
+    is several times faster on CPU; it needs sentence-transformers>=3.2 with the
+    [onnx] extra, and falls back to PyTorch when that is not available.
+
+    Cached: selectors over different example sets (e.g. the experiment runner's
+    per-bucket pools) share one loaded encoder instead of each loading their own.
+    """
+    # Imported here: sentence_transformers pulls in torch/transformers (seconds and
+    # hundreds of MB), which importers of this module should only pay for if they encode
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(
+                model_name, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE}
+            ), "onnx"
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable ({e}); falling back to PyTorch")
+    _limit_torch_threads()
+    return SentenceTransformer(model_name), "torch"
+
+
+_TOKEN_RE = re.compile(r"\w+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def normalize_question(question: str) -> str:
+    """Comparison form of a question: case, spacing and trailing punctuation removed"""
+    return _WHITESPACE_RE.sub(" ", question).strip().rstrip("?.!").rstrip().lower()
+
+
+class _BM25:
+    """Okapi BM25 over a small, fixed corpus, precomputed as a dense doc x term weight matrix."""
+
+    def __init__(self, documents, k1: float = 1.5, b: float = 0.75):
+        tokenized = [_tokenize(doc) for doc in documents]
+        self.vocab = {t: i for i, t in enumerate(sorted({t for doc in tokenized for t in doc}))}
+        tf = np.zeros((len(tokenized), len(self.vocab)), dtype=np.float32)
+        for d, doc in enumerate(tokenized):
+            for t in doc:
+                tf[d, self.vocab[t]] += 1
+        n_docs = max(len(tokenized), 1)
+        doc_freq = (tf > 0).sum(axis=0)
+        idf = np.log((n_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1.0)
+        lengths = tf.sum(axis=1, keepdims=True)
+        avg_length = lengths.mean() if lengths.size and lengths.mean() > 0 else 1.0
+        self.weights = (idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths / avg_length))).astype(np.float32)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query."""
+        cols = [self.vocab[t] for t in _tokenize(query) if t in self.vocab]
+        if not cols:
+            return np.zeros(self.weights.shape[0], dtype=np.float32)
+        return self.weights[:, cols].sum(axis=1)
+
 
 class SemanticExampleSelector:
     """
     Selects the most relevant few-shot examples based on semantic similarity
     to the user's question using sentence embeddings.
+
+    The PyTorch encoder is capped at $SELECTOR_THREADS CPU threads (default 2);
+    set it to about cores / server workers when running several workers.
     """
 
-    def __init__(self, examples: List[Dict], model_name: str = 'all-MiniLM-L6-v2'):
+    def __init__(self, examples: List[Dict], model_name: str = 'all-MiniLM-L6-v2', lexical_weight: float = 0.4,
+                 backend: Optional[str] = None):
         """
         Initialize the semantic selector.
 
@@ -26,50 +139,136 @@ class SemanticExampleSelector:
             examples: List of few-shot examples with 'question' and 'sql_query' keys
             model_name: Name of the sentence transformer model to use
                        'all-MiniLM-L6-v2' is fast and lightweight (80MB)
+            lexical_weight: Share of the ranking score taken from BM25 keyword overlap
+                            (exact tokens like years or 'inventory'); 0 = embeddings only
+            backend: 'torch' or 'onnx' (int8 ONNX Runtime); defaults to $EMBEDDING_BACKEND or 'torch'
         """
         self.examples = examples
         self.model_name = model_name
+        self.lexical_weight = lexical_weight
+        self.backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        self.example_questions = tuple(ex['question'] for ex in examples)
+        self._normalized_questions = tuple(normalize_question(q) for q in self.example_questions)
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Recent question embeddings; the generator encodes the same question for the
+        # cache lookup, example selection and remember(), and retries repeat it
+        self._encode_cache = LRUCache(maxsize=512)
+        self._encode_lock = threading.Lock()
+
+        # L2-normalized float32 embeddings for all example questions. When the
+        # examples and model are unchanged they come from the on-disk cache and the
+        # model itself is only loaded once a question actually needs encoding.
+        cache_path = self._cache_path()
+        if cache_path.exists():
+            logger.info(f"Loading cached embeddings for {len(examples)} examples from {cache_path.name}")
+            self.example_embeddings = np.load(cache_path, mmap_mode="r")
+        else:
+            logger.info(f"Loading sentence transformer model: {model_name}")
+            self._model, self.backend = _load_model(model_name, self.backend)
+            self.example_embeddings = self._embed_examples(self._model)
+
+        # Keyword index over the same questions for hybrid ranking
+        self._bm25 = _BM25(self.example_questions)
+
+    @property
+    def model(self):
+        """The sentence transformer, loaded on first use."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    logger.info(f"Loading sentence transformer model: {self.model_name}")
+                    model, backend = _load_model(self.model_name, self.backend)
+                    if backend != self.backend:
+                        # Fell back from ONNX; the cached vectors came from the other backend
+                        self.backend = backend
+                        self.example_embeddings = self._embed_examples(model)
+                    self._model = model
+        return self._model
+
+    def warm_up(self) -> None:
+        """
+        Get the encoder ready now (e.g. from a background thread at startup) instead of on the first question.
+
+        Loading alone leaves the first forward pass slow (lazy kernel and buffer
+        setup), so one throwaway sentence is encoded as well.
+        """
+        self.model.encode(["warm up"], convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
 
-        # Load embedding model (cached after first load)
-        logger.info(f"Loading sentence transformer model: {model_name}")
-        self.model = SentenceTransformer(model_name)
+    def _cache_path(self) -> Path:
+        # Quantized ONNX vectors differ slightly from PyTorch ones, so cache them separately
+        cache_key = self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+        return _embedding_cache_path(self.example_questions, cache_key)
 
-        # Pre-compute embeddings for all example questions
-        logger.info(f"Computing embeddings for {len(examples)} examples...")
-        self.example_questions = [ex['question'] for ex in examples]
-        self.example_embeddings = self.model.encode(
+    def _embed_examples(self, model) -> np.ndarray:
+        """Encode the example questions and cache them, returning a read-only matrix."""
+        logger.info(f"Computing embeddings for {len(self.example_questions)} examples...")
+        embeddings = model.encode(
             self.example_questions,
-            convert_to_tensor=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
             show_progress_bar=False
-        )
+        ).astype(np.float32)
+        # Written under a temporary name and renamed so concurrent workers never see
+        # a partial file; the memory-mapped copy is shared between worker processes
+        cache_path = self._cache_path()
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            EMBEDDING_CACHE_DIR.mkdir(exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, embeddings)
+            os.replace(tmp_path, cache_path)
+            embeddings = np.load(cache_path, mmap_mode="r")
+        except OSError as e:
+            logger.warning(f"Could not cache example embeddings: {e}")
+            embeddings.flags.writeable = False
         logger.info("Embeddings computed successfully")
+        return embeddings
+
+    def encode(self, question: str) -> np.ndarray:
+        """Encode a question as an L2-normalized float32 vector (read-only, memoized)."""
+        with self._encode_lock:
+            embedding = self._encode_cache.get(question)
+        if embedding is not None:
+            return embedding
 
-    def select_examples(self, question: str, k: int = 5) -> List[Dict]:
+        embedding = self.model.encode(
+            [question],
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )[0].astype(np.float32)
+        embedding.flags.writeable = False
+        with self._encode_lock:
+            self._encode_cache[question] = embedding
+        return embedding
+
+    def select_examples(self, question: str, k: int = 5,
+                        question_embedding: Optional[np.ndarray] = None,
+                        exclude_same_question: bool = False) -> List[Dict]:
         """
         Select k most similar examples to the given question.
 
         Args:
             question: User's natural language question
             k: Number of examples to select (default: 5)
+            question_embedding: Output of encode(question), if the caller already has it
+            exclude_same_question: Leave out examples whose question is the given question
+                                   (up to case, spacing and trailing punctuation), so an
+                                   evaluation can't put the expected answer in the prompt
 
         Returns:
             List of k most relevant examples
         """
-        # Encode the user's question
-        question_embedding = self.model.encode(
-            [question],
-            convert_to_tensor=False,
-            show_progress_bar=False
-        )[0]
+        if question_embedding is None:
+            question_embedding = self.encode(question)
 
-        # Calculate cosine similarity with all examples
-        similarities = self._cosine_similarity(
-            question_embedding,
-            self.example_embeddings
-        )
+        exclude = ()
+        if exclude_same_question:
+            normalized = normalize_question(question)
+            exclude = [i for i, q in enumerate(self._normalized_questions) if q == normalized]
 
-        # Get indices of top k most similar examples
-        top_k_indices = np.argsort(similarities)[::-1][:k]
+        top_k_indices, similarities = self.select_topk(question_embedding, k, question=question, exclude=exclude)
 
         # Return selected examples
         selected_examples = [self.examples[i] for i in top_k_indices]
@@ -82,28 +281,182 @@ class SemanticExampleSelector:
 
         return selected_examples
 
-    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> np.ndarray:
+    def select_topk(self, query_embedding: np.ndarray, k: int, question: Optional[str] = None,
+                    exclude: Sequence[int] = ()):
         """
-        Calculate cosine similarity between a vector and a matrix of vectors.
+        Rank examples against a normalized query embedding.
 
         Args:
-            vec1: Single embedding vector
-            vec2: Matrix of embedding vectors
+            query_embedding: L2-normalized embedding of the question
+            k: Number of examples to select
+            question: Raw question text; when given, BM25 keyword scores are blended in
+            exclude: Indices of examples that must not be selected
 
         Returns:
-            Array of similarity scores
+            (indices of the k most similar examples, best first; all similarity scores)
         """
-        # Normalize vectors
-        vec1_norm = vec1 / np.linalg.norm(vec1)
-        vec2_norm = vec2 / np.linalg.norm(vec2, axis=1, keepdims=True)
+        # Both sides are normalized, so cosine similarity is a single matvec
+        similarities = self.example_embeddings @ query_embedding
+
+        if question is not None and self.lexical_weight > 0:
+            lexical = self._bm25.scores(question)
+            lexical /= lexical.max() + 1e-9
+            similarities = (1 - self.lexical_weight) * similarities + self.lexical_weight * lexical
 
-        # Calculate dot product (cosine similarity for normalized vectors)
-        similarities = np.dot(vec2_norm, vec1_norm)
+        if len(exclude):
+            similarities = similarities.copy()
+            similarities[list(exclude)] = -np.inf
+        k = min(k, len(similarities) - len(set(exclude)))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), similarities
+        top_k = np.argpartition(-similarities, k - 1)[:k]
+        return top_k[np.argsort(-similarities[top_k])], similarities
 
-        return similarities
 
+# Words that don't change what a question asks for; every other word must match for a cache hit
+_FILLER_WORDS = frozenset({
+    "a", "an", "the", "of", "in", "for", "on", "to", "and", "is", "are", "was", "were",
+    "what", "show", "me", "give", "list", "display", "tell", "please", "hul", "s",
+})
 
-def get_selector(examples: List[Dict], model_name: str = 'all-MiniLM-L6-v2') -> SemanticExampleSelector:
+
+class SemanticCache:
+    """
+    Returns stored SQL for questions that are near-duplicates of a known question,
+    so the LLM call can be skipped.
+
+    A hit needs cosine similarity >= threshold AND the same words in both questions,
+    apart from filler like "what was the". Embeddings alone rate "revenue in 2023" vs
+    "revenue in 2024", or "highest" vs "lowest net profit", as near-identical, though
+    they need different SQL; the word check limits hits to questions that use the same
+    words up to case, punctuation and filler.
+    """
+
+    def __init__(self, embeddings: np.ndarray, questions: List[str], sql_queries: List[str],
+                 threshold: float = 0.92, max_entries: int = 1024):
+        """
+        Args:
+            embeddings: L2-normalized embeddings of the seed questions
+            questions: Seed questions (e.g. the few-shot example questions)
+            sql_queries: SQL for each seed question
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Cap on entries added via insert(); oldest are evicted first
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._seed_count = len(questions)
+        self._embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(questions), -1)
+        self._questions = list(questions)
+        self._keywords = [self._extract_keywords(q) for q in questions]
+        self._sql_queries = [sql.strip() for sql in sql_queries]
+
+    @staticmethod
+    def _extract_keywords(question: str) -> frozenset:
+        return frozenset(t for t in _tokenize(question) if t not in _FILLER_WORDS)
+
+    def lookup(self, question: str, question_embedding: np.ndarray) -> Optional[str]:
+        """Return cached SQL for the question, or None on a miss."""
+        with self._lock:
+            embeddings, keywords, sql_queries = self._embeddings, self._keywords, self._sql_queries
+        if not sql_queries:
+            return None
+        scores = embeddings @ question_embedding
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold and keywords[best] == self._extract_keywords(question):
+            return sql_queries[best]
+        return None
+
+    def insert(self, question: str, question_embedding: np.ndarray, sql_query: str) -> None:
+        """Remember SQL that answered a question successfully."""
+        self._append([question], question_embedding[None, :], [sql_query])
+
+    def _append(self, questions: List[str], embeddings: np.ndarray, sql_queries: List[str]) -> None:
+        with self._lock:
+            all_embeddings = np.vstack([self._embeddings, embeddings.astype(np.float32)])
+            all_questions = self._questions + list(questions)
+            keywords = self._keywords + [self._extract_keywords(q) for q in questions]
+            all_sql = self._sql_queries + [sql.strip() for sql in sql_queries]
+            # evict the oldest learned entries; seed entries are kept
+            excess = len(all_sql) - self._seed_count - self.max_entries
+            if excess > 0:
+                n, cut = self._seed_count, self._seed_count + excess
+                all_embeddings = np.vstack([all_embeddings[:n], all_embeddings[cut:]])
+                all_questions = all_questions[:n] + all_questions[cut:]
+                keywords = keywords[:n] + keywords[cut:]
+                all_sql = all_sql[:n] + all_sql[cut:]
+            self._embeddings, self._questions = all_embeddings, all_questions
+            self._keywords, self._sql_queries = keywords, all_sql
+
+    def clear(self) -> None:
+        """Forget every entry added via insert()."""
+        with self._lock:
+            n = self._seed_count
+            self._embeddings = self._embeddings[:n]
+            self._questions = self._questions[:n]
+            self._keywords = self._keywords[:n]
+            self._sql_queries = self._sql_queries[:n]
+
+    def save(self, path: Path, encoder: str, fingerprint: str = "") -> None:
+        """
+        Write the entries added via insert() to disk, so they survive a restart.
+
+        Args:
+            path: Base path; vectors go to <path>.npy and questions/SQL to <path>.json
+            encoder: Name of the model that produced the embeddings, checked by load()
+            fingerprint: Version of whatever the SQL depends on (examples, prompt, schema),
+                         checked by load()
+        """
+        with self._lock:
+            n = self._seed_count
+            embeddings = np.array(self._embeddings[n:], dtype=np.float32)
+            questions, sql_queries = self._questions[n:], self._sql_queries[n:]
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Vectors first: load() rejects a sidecar whose entry count doesn't match them
+        with open(path.with_suffix(".npy"), "wb") as f:
+            np.save(f, embeddings)
+        with open(path.with_suffix(".json"), "w", encoding="utf-8") as f:
+            json.dump({"encoder": encoder, "fingerprint": fingerprint,
+                       "questions": questions, "sql_queries": sql_queries}, f)
+
+    def load(self, path: Path, encoder: str, fingerprint: str = "") -> int:
+        """
+        Re-add entries written by save(); files from another encoder or fingerprint are ignored.
+
+        Returns:
+            Number of entries loaded
+        """
+        path = Path(path)
+        try:
+            with open(path.with_suffix(".json"), encoding="utf-8") as f:
+                saved = json.load(f)
+            embeddings = np.load(path.with_suffix(".npy"))
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load saved SQL cache: {e}")
+            return 0
+        questions, sql_queries = saved["questions"], saved["sql_queries"]
+        if saved.get("fingerprint") != fingerprint:
+            logger.info(f"Ignoring saved SQL cache {path.name}: examples, prompt or schema have changed")
+            return 0
+        if (saved.get("encoder") != encoder or len(embeddings) != len(questions)
+                or embeddings.ndim != 2 or embeddings.shape[1] != self._embeddings.shape[1]):
+            logger.warning(f"Ignoring saved SQL cache {path.name}: it does not match encoder {encoder}")
+            return 0
+        if questions:
+            self._append(questions, embeddings, sql_queries)
+        return len(questions)
+
+
+_MAX_SELECTORS = 8
+_selectors = OrderedDict()  # content key -> selector, least recently used first
+_selector_lock = threading.Lock()
+
+
+def get_selector(examples: List[Dict], model_name: str = 'all-MiniLM-L6-v2',
+                 backend: Optional[str] = None) -> SemanticExampleSelector:
     """
     Factory function to create a semantic example selector.
     Caches the selector to avoid recomputing embeddings.
@@ -111,20 +464,28 @@ def get_selector(examples: List[Dict], model_name: str = 'all-MiniLM-L6-v2') ->
     Args:
         examples: List of few-shot examples
         model_name: Sentence transformer model name
+        backend: 'torch' or 'onnx'; defaults to $EMBEDDING_BACKEND or 'torch'
 
     Returns:
         SemanticExampleSelector instance
     """
-    # Cache the selector as a function attribute
-    cache_key = f"{id(examples)}_{model_name}"
-
-    if not hasattr(get_selector, '_cache'):
-        get_selector._cache = {}
-
-    if cache_key not in get_selector._cache:
-        get_selector._cache[cache_key] = SemanticExampleSelector(examples, model_name)
-
-    return get_selector._cache[cache_key]
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+
+    # Keyed by the examples' content rather than id(), so equal example sets share a
+    # selector and a recycled id can never return one built for different examples
+    cache_key = (tuple((ex['question'], ex['sql_query']) for ex in examples), model_name, backend)
+
+    with _selector_lock:
+        selector = _selectors.get(cache_key)
+        if selector is None:
+            selector = SemanticExampleSelector(examples, model_name, backend=backend)
+            _selectors[cache_key] = selector
+            # Bounded for long-running processes that build many example sets (experiments)
+            while len(_selectors) > _MAX_SELECTORS:
+                _selectors.popitem(last=False)
+        else:
+            _selectors.move_to_end(cache_key)
+    return selector
 
 
 if __name__ == "__main__":
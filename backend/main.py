@@ -3,9 +3,13 @@ Main Multi-Agent Orchestrator
 Coordinates SQL Generation, Execution, Insights Generation, and Visualization
 """
 
+import io
 import os
 import sys
+import threading
+import zipfile
 from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pandas as pd
 from dotenv import load_dotenv
@@ -41,12 +45,23 @@ class FinancialAnalysisOrchestrator:
             max_retry: Maximum number of retry attempts for SQL generation
             enable_visualization: Whether to enable automatic visualization
         """
-        self.sql_generator = SQLGeneratorAgent()
+        self.sql_generator = SQLGeneratorAgent(semantic_cache=True)
         self.sql_executor = SQLExecutorAgent()
         self.insights_generator = InsightsGeneratorAgent()
         self.visualizer = VisualizerAgent() if enable_visualization else None
         self.max_retry = max_retry
         self.enable_visualization = enable_visualization
+        # Runs the insights LLM call alongside visualization in analyze()
+        self._insights_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="insights")
+        
+        # Load the example selector's encoder in the background so it is usually
+        # ready by the time the first question arrives; encode() waits for it otherwise
+        if self.sql_generator.semantic_selector is not None:
+            threading.Thread(
+                target=self.sql_generator.semantic_selector.warm_up,
+                name="selector-warmup",
+                daemon=True
+            ).start()
     
     def analyze(self, question: str, verbose: bool = True) -> Dict:
         """
@@ -93,10 +108,12 @@ class FinancialAnalysisOrchestrator:
             result["error"] = f"SQL Generation Failed: {sql_result['error']}"
             return result
         
-        result["sql_query"] = sql_result["sql_query"]
+        # The current SQL is kept in a local through the retry loop; result is
+        # updated alongside it so early returns still report the last query
+        sql = result["sql_query"] = sql_result["sql_query"]
         
         if verbose:
-            print(f"✓ SQL Generated ({len(sql_result['sql_query'])} characters)")
+            print(f"✓ SQL Generated ({len(sql)} characters)")
         
         # STEP 2: Execute SQL Query (with retry on failure)
         if verbose:
@@ -107,7 +124,7 @@ class FinancialAnalysisOrchestrator:
         
         while attempt <= self.max_retry:
             execution_result = self.sql_executor.execute_with_validation(
-                result["sql_query"],
+                sql,
                 return_df=True
             )
             
@@ -122,7 +139,7 @@ class FinancialAnalysisOrchestrator:
                 
                 fix_result = self.sql_generator.fix_query(
                     question=question,
-                    broken_sql=result["sql_query"],
+                    broken_sql=sql,
                     error=execution_result["error"]
                 )
                 
@@ -130,7 +147,7 @@ class FinancialAnalysisOrchestrator:
                     result["error"] = f"SQL Fix Failed: {fix_result['error']}"
                     return result
                 
-                result["sql_query"] = fix_result["sql_query"]
+                sql = result["sql_query"] = fix_result["sql_query"]
                 attempt += 1
             else:
                 # Max retries reached
@@ -138,35 +155,31 @@ class FinancialAnalysisOrchestrator:
                 return result
         
         # Check if we have results
-        if execution_result["row_count"] == 0:
+        row_count = execution_result["row_count"]
+        if row_count == 0:
             result["error"] = "Query returned no results"
             return result
         
-        result["results"] = execution_result["results"]
+        results_df = result["results"] = execution_result["results"]
+        self.sql_generator.remember(question, sql)
         
         if verbose:
-            print(f"✓ Query Executed ({execution_result['row_count']} rows returned)")
+            print(f"✓ Query Executed ({row_count} rows returned)")
         
         # STEP 3: Generate Insights
+        # Insights and visualization only read the question and results, so the
+        # insights LLM call runs in the background while the visualizer (which
+        # drives matplotlib and stays on this thread) does its work
         if verbose:
             print("\nStep 3/4: Generating Business Insights...")
         
-        insights_result = self.insights_generator.generate(
+        insights_future = self._insights_pool.submit(
+            self.insights_generator.generate,
             question=question,
-            sql_query=result["sql_query"],
-            results=result["results"]
+            sql_query=sql,
+            results=results_df
         )
         
-        if insights_result["error"]:
-            result["error"] = f"Insights Generation Failed: {insights_result['error']}"
-            # Note: We don't return here, since we have valid SQL and results
-        else:
-            result["insights"] = insights_result["insights"]
-            result["summary"] = insights_result["summary"]
-            
-            if verbose:
-                print("✓ Insights Generated")
-        
         # STEP 4: Create Visualizations (if enabled)
         if self.enable_visualization and self.visualizer:
             if verbose:
@@ -174,7 +187,7 @@ class FinancialAnalysisOrchestrator:
             
             viz_result = self.visualizer.analyze_and_visualize(
                 question=question,
-                results=result["results"],
+                results=results_df,
                 output_dir="output"
             )
             
@@ -192,6 +205,18 @@ class FinancialAnalysisOrchestrator:
             if verbose:
                 print("\nStep 4/4: Visualization disabled")
         
+        insights_result = insights_future.result()
+        
+        if insights_result["error"]:
+            result["error"] = f"Insights Generation Failed: {insights_result['error']}"
+            # Note: We don't return here, since we have valid SQL and results
+        else:
+            result["insights"] = insights_result["insights"]
+            result["summary"] = insights_result["summary"]
+            
+            if verbose:
+                print("✓ Insights Generated")
+        
         if verbose:
             print("\n" + "="*80)
             print("ANALYSIS COMPLETE")
@@ -208,109 +233,133 @@ class FinancialAnalysisOrchestrator:
             show_sql: Whether to display the SQL query
             show_viz_paths: Whether to display visualization file paths
         """
-        print("\n" + "="*80)
-        print("QUERY RESULTS")
-        print("="*80)
+        # Assembled in memory and written in one go rather than print-by-print
+        out = io.StringIO()
+        self._write_results(result, out, show_sql, show_viz_paths)
+        sys.stdout.write(out.getvalue())
+        sys.stdout.flush()
+    
+    def _write_results(self, result: Dict, out, show_sql: bool, show_viz_paths: bool):
+        """Write the display_results() report to the text stream out."""
+        print("\n" + "="*80, file=out)
+        print("QUERY RESULTS", file=out)
+        print("="*80, file=out)
         
         if result["error"]:
-            print(f"\n❌ ERROR: {result['error']}\n")
+            print(f"\n❌ ERROR: {result['error']}\n", file=out)
             if result["sql_query"] and show_sql:
-                print("Generated SQL (for debugging):")
-                print(result["sql_query"])
+                print("Generated SQL (for debugging):", file=out)
+                print(result["sql_query"], file=out)
             return
         
         # Display SQL
         if show_sql and result["sql_query"]:
-            print("\nSQL Query:")
-            print("-" * 80)
-            print(result["sql_query"])
-            print("-" * 80)
+            print("\nSQL Query:", file=out)
+            print("-" * 80, file=out)
+            print(result["sql_query"], file=out)
+            print("-" * 80, file=out)
         
         # Display Results Table
         if result["results"] is not None:
-            print(f"\nData ({len(result['results'])} rows):")
-            print("-" * 80)
-            print(result["results"].to_string(index=False))
-            print("-" * 80)
+            print(f"\nData ({len(result['results'])} rows):", file=out)
+            print("-" * 80, file=out)
+            result["results"].to_string(buf=out, index=False)
+            print(file=out)
+            print("-" * 80, file=out)
         
         # Display Insights
         if result["insights"]:
-            print("\n" + "="*80)
-            print("BUSINESS INSIGHTS")
-            print("="*80)
-            print(result["insights"])
+            print("\n" + "="*80, file=out)
+            print("BUSINESS INSIGHTS", file=out)
+            print("="*80, file=out)
+            print(result["insights"], file=out)
         
         # Display Visualizations
         if result.get("visualizations") and result["visualizations"]["visualized"]:
-            print("\n" + "="*80)
-            print("VISUALIZATIONS")
-            print("="*80)
+            print("\n" + "="*80, file=out)
+            print("VISUALIZATIONS", file=out)
+            print("="*80, file=out)
             
             for chart in result["visualizations"]["charts"]:
-                print(f"\n📊 {chart['title']}")
-                print(f"   Type: {chart['type']}")
+                print(f"\n📊 {chart['title']}", file=out)
+                print(f"   Type: {chart['type']}", file=out)
                 if chart.get('description'):
-                    print(f"   Description: {chart['description']}")
+                    print(f"   Description: {chart['description']}", file=out)
                 if show_viz_paths:
-                    print(f"   Location: {chart['path']}")
+                    print(f"   Location: {chart['path']}", file=out)
             
-            print(f"\n✓ {len(result['visualizations']['charts'])} chart(s) saved to 'output/' directory")
+            print(f"\n✓ {len(result['visualizations']['charts'])} chart(s) saved to 'output/' directory", file=out)
         elif result.get("visualizations"):
-            print("\n" + "="*80)
-            print("VISUALIZATIONS")
-            print("="*80)
-            print(f"\n○ {result['visualizations']['reason']}")
+            print("\n" + "="*80, file=out)
+            print("VISUALIZATIONS", file=out)
+            print("="*80, file=out)
+            print(f"\n○ {result['visualizations']['reason']}", file=out)
         
-        print("\n" + "="*80)
+        print("\n" + "="*80, file=out)
     
-    def export_results(self, result: Dict, output_dir: str = "output"):
+    def export_results(self, result: Dict, output_dir: str = "output", single_files: bool = False):
         """
         Export results to files.
         
         Args:
             result: Result dictionary from analyze()
             output_dir: Directory to save output files
+            single_files: Write separate .sql/.csv/.md files instead of one
+                          analysis_<timestamp>.zip containing them
         """
         # Create output directory
-        Path(output_dir).mkdir(exist_ok=True)
+        out_dir = Path(output_dir)
+        out_dir.mkdir(exist_ok=True)
         
         timestamp = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
         
+        # Render every artifact in memory first: name -> text
+        files = {}
+        
         # Export SQL
         if result["sql_query"]:
-            sql_file = Path(output_dir) / f"query_{timestamp}.sql"
-            with open(sql_file, 'w') as f:
-                f.write(f"-- Question: {result['question']}\n\n")
-                f.write(result["sql_query"])
-            print(f"✓ SQL saved to: {sql_file}")
+            files[f"query_{timestamp}.sql"] = f"-- Question: {result['question']}\n\n" + result["sql_query"]
         
         # Export Results
         if result["results"] is not None:
-            csv_file = Path(output_dir) / f"results_{timestamp}.csv"
-            result["results"].to_csv(csv_file, index=False)
-            print(f"✓ Results saved to: {csv_file}")
+            files[f"results_{timestamp}.csv"] = result["results"].to_csv(index=False)
         
         # Export Insights
         if result["insights"]:
-            insights_file = Path(output_dir) / f"insights_{timestamp}.md"
-            with open(insights_file, 'w') as f:
-                f.write(f"# Financial Analysis Insights\n\n")
-                f.write(f"**Question:** {result['question']}\n\n")
-                f.write(f"**Date:** {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                f.write("---\n\n")
-                f.write(result["insights"])
-                
-                # Add visualization references if any
-                if result.get("visualizations") and result["visualizations"]["visualized"]:
-                    f.write("\n\n---\n\n## Visualizations\n\n")
-                    for chart in result["visualizations"]["charts"]:
-                        f.write(f"\n### {chart['title']}\n")
-                        f.write(f"- **Type:** {chart['type']}\n")
-                        if chart.get('description'):
-                            f.write(f"- **Description:** {chart['description']}\n")
-                        f.write(f"- **File:** {Path(chart['path']).name}\n")
+            md = io.StringIO()
+            md.write(f"# Financial Analysis Insights\n\n")
+            md.write(f"**Question:** {result['question']}\n\n")
+            md.write(f"**Date:** {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            md.write("---\n\n")
+            md.write(result["insights"])
             
-            print(f"✓ Insights saved to: {insights_file}")
+            # Add visualization references if any
+            if result.get("visualizations") and result["visualizations"]["visualized"]:
+                md.write("\n\n---\n\n## Visualizations\n\n")
+                for chart in result["visualizations"]["charts"]:
+                    md.write(f"\n### {chart['title']}\n")
+                    md.write(f"- **Type:** {chart['type']}\n")
+                    if chart.get('description'):
+                        md.write(f"- **Description:** {chart['description']}\n")
+                    md.write(f"- **File:** {Path(chart['path']).name}\n")
+            files[f"insights_{timestamp}.md"] = md.getvalue()
+        
+        labels = {".sql": "SQL", ".csv": "Results", ".md": "Insights"}
+        if single_files:
+            for name, text in files.items():
+                path = out_dir / name
+                path.write_text(text)
+                print(f"✓ {labels[path.suffix]} saved to: {path}")
+        elif files:
+            # One archive, written under a temporary name and renamed into place so
+            # anything watching the directory never sees a partial file
+            zip_path = out_dir / f"analysis_{timestamp}.zip"
+            tmp_path = zip_path.with_name(zip_path.name + ".tmp")
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+                for name, text in files.items():
+                    archive.writestr(name, text)
+            os.replace(tmp_path, zip_path)
+            print(f"✓ {', '.join(labels[Path(n).suffix] for n in files)} saved to: {zip_path}")
         
         # Note about visualizations
         if result.get("visualizations") and result["visualizations"]["visualized"]:
@@ -3,18 +3,79 @@ BIRD Dataset Integration for Generalization Testing
 Implements connector for BIRD benchmark to test domain transfer
 """
 
+from __future__ import annotations
+
 import json
-import requests
+import mmap
 import os
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-import pandas as pd
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, Optional
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+
+if TYPE_CHECKING:
+    # Only the evaluation runner works with DataFrames; loading BIRD data doesn't need pandas
+    import pandas as pd
+
+try:
+    # C JSON parser/serializer; several times faster than the stdlib on BIRD's dev.json
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Incremental JSON parser; lets loads stop after the records they need
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# Files at least this large are parsed from a memory map instead of a bytes copy
+_MMAP_MIN_BYTES = 1 << 20
+
+
+def _read_json(path: Path) -> Any:
+    """Parse a JSON file, with orjson when it is installed."""
+    if orjson is not None:
+        path = Path(path)
+        if path.stat().st_size < _MMAP_MIN_BYTES:
+            return orjson.loads(path.read_bytes())
+        # orjson parses straight from the mapped pages, so the file isn't also held as bytes
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _iter_json_array(path: Path) -> Iterator[Any]:
+    """
+    Yield the items of a top-level JSON array one at a time.
+
+    With ijson installed the file is parsed incrementally, so a consumer that stops
+    early never parses (or holds) the rest of it; otherwise the whole file is parsed.
+    """
+    if ijson is None:
+        yield from _read_json(path)
+        return
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'item', use_float=True)
+
+
+def _write_json(obj: Any, path: Path) -> None:
+    """Write obj as indented JSON, with orjson when it is installed."""
+    if orjson is not None:
+        Path(path).write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BIRDExample:
-    """Container for BIRD dataset example"""
+    """Container for BIRD dataset example (immutable, no per-instance __dict__)"""
     question_id: str
     db_id: str
     question: str
@@ -24,6 +85,42 @@ class BIRDExample:
     database_schema: Dict[str, Any]
 
 
+@lru_cache(maxsize=8)
+def _load_examples(
+    dev_file: str,
+    mtime_ns: int,
+    max_examples: int,
+    difficulty_filter: Optional[str]
+) -> tuple[BIRDExample, ...]:
+    """
+    Parse up to max_examples BIRD records that pass the difficulty filter.
+
+    Cached per (file, mtime, max_examples, filter) so repeated loads in one process don't
+    re-read dev.json; the examples are frozen, so sharing them between callers is safe.
+    """
+    records = _iter_json_array(Path(dev_file))
+
+    # Apply difficulty filter
+    if difficulty_filter:
+        records = (item for item in records if item.get('difficulty') == difficulty_filter)
+
+    # question_id/db_id/question/SQL are present on every BIRD record; evidence and
+    # difficulty are the only optional fields. Positional args skip kwarg matching.
+    # islice stops the stream once enough records have passed the filter.
+    return tuple(
+        BIRDExample(
+            item['question_id'],
+            item['db_id'],
+            item['question'],
+            item['SQL'],
+            item.get('evidence', ''),
+            item.get('difficulty', 'unknown'),
+            {}  # database_schema: would load from schemas_file in full implementation
+        )
+        for item in islice(records, max_examples)
+    )
+
+
 class BIRDDatasetLoader:
     """
     Loader for BIRD (BIg Bench for LaRge-scale Database Grounded Text-to-SQL) dataset
@@ -67,15 +164,13 @@ class BIRDDatasetLoader:
         if not self.dev_file.exists():
             print("\nCreating placeholder dev.json for demonstration...")
             placeholder_data = self._create_placeholder_bird_data()
-            with open(self.dev_file, 'w') as f:
-                json.dump(placeholder_data, f, indent=2)
+            _write_json(placeholder_data, self.dev_file)
             print(f"✓ Created placeholder at: {self.dev_file}")
 
         if not self.schemas_file.exists():
             print("\nCreating placeholder schema file...")
             placeholder_schemas = {"databases": []}
-            with open(self.schemas_file, 'w') as f:
-                json.dump(placeholder_schemas, f, indent=2)
+            _write_json(placeholder_schemas, self.schemas_file)
             print(f"✓ Created placeholder at: {self.schemas_file}")
 
     def _create_placeholder_bird_data(self) -> List[Dict]:
@@ -114,30 +209,15 @@ class BIRDDatasetLoader:
         Returns:
             List of BIRDExample objects
         """
-        if not self.dev_file.exists():
+        # One stat both checks for dev.json and gives the mtime the cache is keyed on, so
+        # replacing the file (e.g. placeholder -> real data) invalidates cached examples
+        try:
+            mtime_ns = self.dev_file.stat().st_mtime_ns
+        except FileNotFoundError:
             print("BIRD dataset not found. Creating placeholders...")
             self.download_bird_dataset()
-
-        # Load data
-        with open(self.dev_file, 'r') as f:
-            bird_data = json.load(f)
-
-        examples = []
-        for item in bird_data[:max_examples]:
-            # Apply difficulty filter
-            if difficulty_filter and item.get('difficulty') != difficulty_filter:
-                continue
-
-            example = BIRDExample(
-                question_id=item.get('question_id', 'unknown'),
-                db_id=item.get('db_id', 'unknown'),
-                question=item.get('question', ''),
-                sql=item.get('SQL', ''),
-                evidence=item.get('evidence', ''),
-                difficulty=item.get('difficulty', 'unknown'),
-                database_schema={}  # Would load from schemas_file in full implementation
-            )
-            examples.append(example)
+            mtime_ns = self.dev_file.stat().st_mtime_ns
+        examples = list(_load_examples(str(self.dev_file), mtime_ns, max_examples, difficulty_filter))
 
         print(f"Loaded {len(examples)} BIRD examples")
         return examples
@@ -155,10 +235,8 @@ class BIRDDatasetLoader:
         Returns:
             List of test cases compatible with our evaluation framework
         """
-        test_cases = []
-
-        for example in bird_examples:
-            test_case = {
+        return [
+            {
                 'question_id': example.question_id,
                 'question': example.question,
                 'category': f'bird_{example.db_id}',
@@ -168,28 +246,22 @@ class BIRDDatasetLoader:
                 'source': 'BIRD',
                 'db_id': example.db_id
             }
-            test_cases.append(test_case)
-
-        return test_cases
+            for example in bird_examples
+        ]
 
-    def prepare_bird_subset_for_evaluation(
-        self,
-        num_examples: int = 30,
-        output_file: Optional[str] = None
-    ) -> str:
+    def build_bird_subset(self, num_examples: int = 30) -> Dict[str, Any]:
         """
-        Prepare a subset of BIRD dataset for evaluation
+        Build a BIRD evaluation subset in memory
+
+        Same structure as test_questions.json ({"metadata", "test_questions"}), so
+        in-process evaluation can use it directly without a JSON round trip.
 
         Args:
             num_examples: Number of examples to include
-            output_file: Output file path (default: experiments/data/bird_test_subset.json)
 
         Returns:
-            Path to the created file
+            Dataset dictionary
         """
-        if output_file is None:
-            output_file = self.bird_dir.parent / "bird_test_subset.json"
-
         # Load BIRD examples
         bird_examples = self.load_bird_examples(max_examples=num_examples)
 
@@ -197,12 +269,12 @@ class BIRDDatasetLoader:
         test_cases = self.convert_to_test_format(bird_examples)
 
         # Create dataset structure
-        dataset = {
+        return {
             "metadata": {
                 "dataset_name": "BIRD Benchmark Subset",
                 "source": "BIRD (BIg Bench for LaRge-scale Database Grounded Text-to-SQL)",
                 "version": "1.0",
-                "created_date": pd.Timestamp.now().isoformat(),
+                "created_date": datetime.now().isoformat(),
                 "description": "Subset of BIRD dataset for testing generalization capability",
                 "total_questions": len(test_cases),
                 "purpose": "Domain transfer and generalization testing"
@@ -210,9 +282,28 @@ class BIRDDatasetLoader:
             "test_questions": test_cases
         }
 
+    def prepare_bird_subset_for_evaluation(
+        self,
+        num_examples: int = 30,
+        output_file: Optional[str] = None
+    ) -> str:
+        """
+        Prepare a subset of BIRD dataset for evaluation and save it as JSON
+
+        Args:
+            num_examples: Number of examples to include
+            output_file: Output file path (default: experiments/data/bird_test_subset.json)
+
+        Returns:
+            Path to the created file
+        """
+        if output_file is None:
+            output_file = self.bird_dir.parent / "bird_test_subset.json"
+
+        dataset = self.build_bird_subset(num_examples)
+
         # Save
-        with open(output_file, 'w') as f:
-            json.dump(dataset, f, indent=2)
+        _write_json(dataset, output_file)
 
         print(f"✓ BIRD test subset saved to: {output_file}")
         return str(output_file)
@@ -271,6 +362,7 @@ class BIRDEvaluationRunner:
         print("\nThis creates the framework for BIRD evaluation.")
         print(f"BIRD test file created at: {bird_test_file}")
 
+        import pandas as pd
         return pd.DataFrame()  # Placeholder
 
     def create_comparison_report(
@@ -290,28 +382,42 @@ class BIRDEvaluationRunner:
         if output_file is None:
             output_file = self.experiments_dir / "analysis" / "domain_transfer_analysis.json"
 
+        import numpy as np
+
+        # execution_success / results_match / sql_similarity_score as percentages, one reduce per frame
+        metric_columns = ['execution_success', 'results_match', 'sql_similarity_score']
+
+        def metric_percentages(results: pd.DataFrame) -> np.ndarray:
+            if len(results) == 0:
+                return np.zeros(len(metric_columns))
+            values = np.array([results[c].to_numpy(dtype=np.float64) for c in metric_columns])
+            return values.mean(axis=1) * 100.0
+
+        hul_pct = metric_percentages(hul_results)
+        bird_pct = metric_percentages(bird_results)
+        gap = hul_pct - bird_pct
+
         comparison = {
             "in_domain_performance": {
                 "dataset": "HUL Financial",
-                "execution_accuracy": (hul_results['execution_success'].mean() * 100),
-                "semantic_correctness": (hul_results['results_match'].mean() * 100),
-                "avg_sql_similarity": (hul_results['sql_similarity_score'].mean() * 100)
+                "execution_accuracy": float(hul_pct[0]),
+                "semantic_correctness": float(hul_pct[1]),
+                "avg_sql_similarity": float(hul_pct[2])
             },
             "out_of_domain_performance": {
                 "dataset": "BIRD Benchmark",
-                "execution_accuracy": (bird_results['execution_success'].mean() * 100) if len(bird_results) > 0 else 0,
-                "semantic_correctness": (bird_results['results_match'].mean() * 100) if len(bird_results) > 0 else 0,
-                "avg_sql_similarity": (bird_results['sql_similarity_score'].mean() * 100) if len(bird_results) > 0 else 0
+                "execution_accuracy": float(bird_pct[0]),
+                "semantic_correctness": float(bird_pct[1]),
+                "avg_sql_similarity": float(bird_pct[2])
             },
             "transfer_gap": {
                 "note": "Difference between in-domain and out-of-domain performance",
-                "execution_drop": 0,  # To be calculated
-                "semantic_drop": 0
+                "execution_drop": float(gap[0]),
+                "semantic_drop": float(gap[1])
             }
         }
 
-        with open(output_file, 'w') as f:
-            json.dump(comparison, f, indent=2)
+        _write_json(comparison, output_file)
 
         print(f"✓ Comparison report saved to: {output_file}")
 
@@ -3,38 +3,221 @@ Experiment Runner for NL2SQL Few-Shot Learning Research
 Orchestrates experiments with different configurations
 """
 
+import atexit
+import hashlib
 import json
+import logging
+import queue
 import pandas as pd
 import os
+import sqlite3
 import sys
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional
+from dataclasses import dataclass
 from datetime import datetime
 import random
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from agents.sql_generator import SQLGeneratorAgent
+from agents.sql_generator import (
+    SQLGeneratorAgent, PROMPT_PREFIX, EXAMPLE_TEMPLATE, GENERATE_INSTRUCTION, MAX_SQL_TOKENS, STOP_SEQUENCES
+)
 from research.evaluation_metrics import EvaluationMetrics
 from few_shot_examples.examples import FEW_SHOT_EXAMPLES
 
+try:
+    # C JSON parser; faster than the stdlib for the test dataset
+    import orjson
+except ImportError:
+    orjson = None
+
+# Progress goes through a queue to one writer thread, so worker threads never block on
+# console/file I/O and their lines don't interleave
+logger = logging.getLogger("experiment")
+_log_listener: Optional[QueueListener] = None
+
+
+def _start_logging(log_path: Path) -> None:
+    """Send the experiment logger to stdout and log_path via a background listener (once per process)"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    log_file = logging.FileHandler(log_path, encoding="utf-8")
+    log_file.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False  # other modules configure the root logger too
+    _log_listener = QueueListener(log_queue, console, log_file)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+
+def _flush_log() -> None:
+    """Block until everything logged so far has been written"""
+    if _log_listener is not None:
+        _log_listener.stop()  # drains the queue
+        _log_listener.start()
+
+
+# LLM requests allowed in flight at once; the rate limiter still spaces out their starts
+MAX_CONCURRENT_REQUESTS = 4
+
+# Attempts per question when the provider reports a rate limit, and the first backoff (doubles)
+MAX_RETRIES = 3
+RETRY_DELAY = 10  # seconds
+
+# Groq's 429 message says when the budget frees up: "Please try again in 7.03s" / "2m5.1s" / "380ms"
+_RETRY_AFTER_RE = re.compile(r"try again in (?:(\d+)m(?!s))?(\d+(?:\.\d+)?)(ms|s)", re.IGNORECASE)
+
+
+def _retry_after(error: str) -> Optional[float]:
+    """Seconds the provider asked us to wait, if its rate-limit error says"""
+    match = _RETRY_AFTER_RE.search(error)
+    if match is None:
+        return None
+    minutes, amount, unit = match.groups()
+    seconds = float(amount) / 1000 if unit.lower() == 'ms' else float(amount)
+    return seconds + 60 * int(minutes or 0)
+
+
+# SQL keywords that mark an example's pattern; word-bounded so e.g. OVERALL doesn't count
+_PATTERN_RE = re.compile(r"\b(WITH|WINDOW|OVER|CASE)\b", re.IGNORECASE)
+
+
+def _sql_pattern(sql: str) -> str:
+    """Pattern key of a query from its SQL keywords, e.g. 'CTE-WINDOW' or 'SIMPLE'"""
+    keywords = {k.upper() for k in _PATTERN_RE.findall(sql)}
+    pattern = []
+    if 'WITH' in keywords:
+        pattern.append('CTE')
+    if 'WINDOW' in keywords or 'OVER' in keywords:
+        pattern.append('WINDOW')
+    if 'CASE' in keywords:
+        pattern.append('CASE')
+    return '-'.join(pattern) if pattern else 'SIMPLE'
+
+
+def _pattern_diverse_order(examples) -> List[int]:
+    """Example indices: the first example of each pattern, then the rest, each in example order"""
+    first_of_pattern = {}
+    for i, example in enumerate(examples):
+        first_of_pattern.setdefault(_sql_pattern(example['sql_query']), i)
+    diverse = sorted(first_of_pattern.values())
+    chosen = set(diverse)
+    return diverse + [i for i in range(len(examples)) if i not in chosen]
+
+
+# Classified once at import; 'pattern_based' selection is then a slice of this order
+_PATTERN_BASED_ORDER = _pattern_diverse_order(FEW_SHOT_EXAMPLES)
+
+
+@dataclass(slots=True, frozen=True)
+class TestQuestion:
+    """One question of the test dataset (the fields the experiments use)"""
+    id: str
+    question: str
+    category: str
+    complexity: str
+    ground_truth_sql: str
+    sql_pattern: str = 'unknown'
+
+
+class RateLimiter:
+    """
+    Spaces out request starts to stay under a requests-per-minute budget.
+
+    Thread-safe; one limiter is shared by every worker of an experiment run.
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self._next_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next request slot"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        time.sleep(start - now)
+
+    def pause(self, seconds: float):
+        """Hold back every worker's next request (the provider reported an exhausted budget)"""
+        with self._lock:
+            self._next_start = max(self._next_start, time.monotonic() + seconds)
+
+
+# Prompt text (schema included) and generation limits; part of every response cache
+# key, so editing the prompt stops old SQL from being served
+_PROMPT_FINGERPRINT = hashlib.sha1(
+    "\0".join([PROMPT_PREFIX, EXAMPLE_TEMPLATE, GENERATE_INSTRUCTION, str(MAX_SQL_TOKENS), repr(STOP_SEQUENCES)]).encode("utf-8")
+).hexdigest()
+
+
+class ResponseCache:
+    """
+    Generated SQL persisted in SQLite, keyed by prompt version, model, example pool and question.
+
+    Generation runs at temperature 0, so a question asked again with the same model
+    and examples (an overlapping bucket, or a re-run after a crash) is answered from
+    here without spending an LLM request.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        # Shared by the generation worker threads; every access holds the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, sql TEXT NOT NULL)")
+
+    @staticmethod
+    def key(model_name: str, examples: List[Dict], max_examples: int, question: str,
+            exclude_same_question: bool = False) -> str:
+        """Cache key; changes whenever anything that goes into the prompt changes"""
+        digest = hashlib.sha1(
+            f"{_PROMPT_FINGERPRINT}\0{model_name}\0{max_examples}\0{exclude_same_question:d}\0{question}".encode("utf-8")
+        )
+        for ex in examples:
+            digest.update(f"\0{ex['question']}\0{ex['sql_query']}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT sql FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, sql: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, sql) VALUES (?, ?)", (key, sql))
+
 
 class ExperimentRunner:
     """
     Orchestrates NL2SQL experiments with different configurations
     """
 
-    def __init__(self, test_dataset_path: str):
+    def __init__(self, test_dataset_path: str, cache_responses: bool = True):
         """
         Initialize experiment runner
 
         Args:
             test_dataset_path: Path to test_questions.json
+            cache_responses: Reuse SQL already generated for the same model, examples and
+                             question (experiments/.llm_cache.sqlite3) instead of re-asking the LLM
         """
         self.test_dataset_path = test_dataset_path
-        self.test_data = self._load_test_data()
+        self.test_questions = self._load_test_data()
         self.evaluator = EvaluationMetrics()
         self.experiments_dir = Path(__file__).parent.parent / "experiments"
         self.results_dir = self.experiments_dir / "results"
@@ -44,17 +227,40 @@ class ExperimentRunner:
         self.results_dir.mkdir(parents=True, exist_ok=True)
         self.analysis_dir.mkdir(parents=True, exist_ok=True)
 
-    def _load_test_data(self) -> Dict[str, Any]:
-        """Load test dataset from JSON"""
-        with open(self.test_dataset_path, 'r') as f:
-            return json.load(f)
+        _start_logging(self.experiments_dir / "run.log")
+
+        # One agent (LLM client + selectors) per model; buckets only swap its examples
+        self._agents: Dict[str, SQLGeneratorAgent] = {}
+
+        self.response_cache = ResponseCache(self.experiments_dir / ".llm_cache.sqlite3") if cache_responses else None
+
+    def _load_test_data(self) -> List[TestQuestion]:
+        """Load the test questions from JSON"""
+        if orjson is not None:
+            with open(self.test_dataset_path, 'rb') as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(self.test_dataset_path, 'r') as f:
+                data = json.load(f)
+        return [
+            TestQuestion(
+                id=q['id'],
+                question=q['question'],
+                category=q['category'],
+                complexity=q['complexity'],
+                ground_truth_sql=q['ground_truth_sql'],
+                sql_pattern=q.get('sql_pattern', 'unknown')
+            )
+            for q in data['test_questions']
+        ]
 
     def run_few_shot_experiment(
         self,
         num_examples_list: List[int] = [0, 3, 5, 10, 15],
         model_name: str = "llama-3.3-70b-versatile",
         experiment_name: Optional[str] = None,
-        random_seed: int = 42
+        random_seed: int = 42,
+        requests_per_minute: float = 6
     ) -> pd.DataFrame:
         """
         Experiment 1: Test impact of different numbers of few-shot examples
@@ -63,6 +269,7 @@ class ExperimentRunner:
             num_examples_list: List of different few-shot example counts to test
             model_name: LLM model to use
             experiment_name: Custom name for the experiment
+            requests_per_minute: LLM request budget (Groq free tier is stricter than advertised)
 
         Returns:
             DataFrame with results
@@ -73,77 +280,38 @@ class ExperimentRunner:
         # Set random seed for reproducibility
         random.seed(random_seed)
 
-        print(f"\n{'='*80}")
-        print(f"EXPERIMENT: Few-Shot Learning Curve")
-        print(f"Testing with: {num_examples_list} examples")
-        print(f"Model: {model_name}")
-        print(f"Random Seed: {random_seed}")
-        print(f"{'='*80}\n")
+        logger.info(f"\n{'='*80}")
+        logger.info(f"EXPERIMENT: Few-Shot Learning Curve")
+        logger.info(f"Testing with: {num_examples_list} examples")
+        logger.info(f"Model: {model_name}")
+        logger.info(f"Random Seed: {random_seed}")
+        logger.info(f"{'='*80}\n")
 
+        output_path = self.results_dir / f"{experiment_name}.csv"
         all_results = []
 
         for num_examples in num_examples_list:
-            print(f"\n--- Running with {num_examples} few-shot examples ---")
+            logger.info(f"\n--- Running with {num_examples} few-shot examples ---")
 
             # Create agent with specific number of examples
-            agent = self._create_agent_with_n_examples(num_examples, model_name)
+            agent = self._agent_with_n_examples(num_examples, model_name)
 
             # Run on all test questions
-            test_cases = []
-            for i, question_data in enumerate(self.test_data['test_questions'], 1):
-                print(f"Processing question {i}/{len(self.test_data['test_questions'])}: {question_data['id']}")
-
-                # Add delay to respect rate limits (Groq free tier is stricter than expected)
-                if i > 1:  # Skip delay for first question
-                    time.sleep(10)  # 10 seconds between requests = ~6 requests/min (very conservative)
-
-                # Generate SQL with retry on rate limit
-                max_retries = 3
-                retry_delay = 10  # seconds
-
-                for attempt in range(max_retries):
-                    result = agent.generate(question_data['question'])
-                    generated_sql = result.get('sql_query', '')
-
-                    # Check if rate limited
-                    if result.get('error') and 'rate limit' in result.get('error', '').lower():
-                        if attempt < max_retries - 1:
-                            print(f"  ⚠ Rate limited. Waiting {retry_delay}s before retry {attempt + 2}/{max_retries}...")
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            print(f"  ❌ Rate limit persists after {max_retries} attempts")
-                    break
-
-                # If generation failed, try to fix
-                if result.get('error') or not generated_sql:
-                    error_msg = result.get('error', 'No SQL generated')
-                    print(f"  ⚠ Generation failed: {error_msg[:100]}")
-
-                    # Don't attempt fix if rate limited
-                    if 'rate limit' not in error_msg.lower():
-                        print(f"     Attempting fix...")
-                        time.sleep(10)  # Respect rate limit for fix attempt
-                        fix_result = agent.fix_query(
-                            question_data['question'],
-                            generated_sql or "SELECT 1;",
-                            error_msg
-                        )
-                        generated_sql = fix_result.get('sql_query', generated_sql)
-                        if fix_result.get('error'):
-                            print(f"     Fix also failed: {fix_result.get('error')[:100]}")
+            generated = self._generate_all(agent, requests_per_minute, fix_failures=True)
 
+            test_cases = []
+            for q, generated_sql in zip(self.test_questions, generated):
                 test_cases.append({
-                    'question_id': question_data['id'],
-                    'question': question_data['question'],
-                    'category': question_data['category'],
-                    'complexity': question_data['complexity'],
+                    'question_id': q.id,
+                    'question': q.question,
+                    'category': q.category,
+                    'complexity': q.complexity,
                     'generated_sql': generated_sql,
-                    'ground_truth_sql': question_data['ground_truth_sql']
+                    'ground_truth_sql': q.ground_truth_sql
                 })
 
             # Evaluate all test cases
-            print(f"\nEvaluating {len(test_cases)} queries...")
+            logger.info(f"\nEvaluating {len(test_cases)} queries...")
             results_df = self.evaluator.batch_evaluate(
                 test_cases,
                 num_few_shot=num_examples,
@@ -154,22 +322,23 @@ class ExperimentRunner:
             results_df['num_few_shot_examples'] = num_examples
             results_df['experiment_name'] = experiment_name
 
+            # Save each bucket as soon as it is evaluated, so a crash or rate-limit
+            # abort later in the run keeps the buckets already completed
+            self._append_csv(results_df, output_path, first_write=not all_results)
             all_results.append(results_df)
 
             # Print summary
             accuracy = (results_df['execution_success'].sum() / len(results_df)) * 100
-            print(f"✓ Execution Accuracy: {accuracy:.2f}%")
+            logger.info(f"✓ Execution Accuracy: {accuracy:.2f}%")
+            _flush_log()
 
-        # Combine all results
+        # Combine all results (already saved bucket by bucket)
         combined_df = pd.concat(all_results, ignore_index=True)
-
-        # Save results
-        output_path = self.results_dir / f"{experiment_name}.csv"
-        combined_df.to_csv(output_path, index=False)
-        print(f"\n✓ Results saved to: {output_path}")
+        logger.info(f"\n✓ Results saved to: {output_path}")
 
         # Generate summary
         self._generate_experiment_summary(combined_df, experiment_name)
+        _flush_log()
 
         return combined_df
 
@@ -179,7 +348,8 @@ class ExperimentRunner:
         num_examples: int = 10,
         model_name: str = "llama-3.3-70b-versatile",
         experiment_name: Optional[str] = None,
-        random_seed: int = 42
+        random_seed: int = 42,
+        requests_per_minute: float = 6
     ) -> pd.DataFrame:
         """
         Experiment 2: Test different few-shot example selection strategies
@@ -189,6 +359,7 @@ class ExperimentRunner:
             num_examples: Number of examples to use
             model_name: LLM model to use
             experiment_name: Custom name for the experiment
+            requests_per_minute: LLM request budget (Groq free tier is stricter than advertised)
 
         Returns:
             DataFrame with results
@@ -199,44 +370,44 @@ class ExperimentRunner:
         # Set random seed for reproducibility
         random.seed(random_seed)
 
-        print(f"\n{'='*80}")
-        print(f"EXPERIMENT: Example Selection Strategy")
-        print(f"Strategies: {strategies}")
-        print(f"Number of examples: {num_examples}")
-        print(f"Model: {model_name}")
-        print(f"Random Seed: {random_seed}")
-        print(f"{'='*80}\n")
+        logger.info(f"\n{'='*80}")
+        logger.info(f"EXPERIMENT: Example Selection Strategy")
+        logger.info(f"Strategies: {strategies}")
+        logger.info(f"Number of examples: {num_examples}")
+        logger.info(f"Model: {model_name}")
+        logger.info(f"Random Seed: {random_seed}")
+        logger.info(f"{'='*80}\n")
 
+        output_path = self.results_dir / f"{experiment_name}.csv"
         all_results = []
 
         for strategy in strategies:
-            print(f"\n--- Testing strategy: {strategy} ---")
+            logger.info(f"\n--- Testing strategy: {strategy} ---")
 
             # Select examples based on strategy
             selected_examples = self._select_examples(strategy, num_examples)
 
-            # Create agent with selected examples
-            agent = self._create_agent_with_examples(selected_examples, model_name)
+            # Create agent with selected examples; it puts the num_examples most similar
+            # of them in each question's prompt (all of them, unless similarity_based).
+            # Several test questions are also example questions, and per-question selection
+            # would rank that example (the expected SQL) first, so it is left out.
+            agent = self._agent_with_examples(
+                selected_examples, model_name, max_examples=num_examples,
+                exclude_same_question=(strategy == 'similarity_based')
+            )
 
             # Run on all test questions
-            test_cases = []
-            for i, question_data in enumerate(self.test_data['test_questions'], 1):
-                print(f"Processing question {i}/{len(self.test_data['test_questions'])}: {question_data['id']}")
-
-                # Add delay to respect rate limits (Groq free tier is stricter than expected)
-                if i > 1:
-                    time.sleep(10)  # 10 seconds between requests = ~6 requests/min (very conservative)
-
-                result = agent.generate(question_data['question'])
-                generated_sql = result.get('sql_query', '')
+            generated = self._generate_all(agent, requests_per_minute)
 
+            test_cases = []
+            for q, generated_sql in zip(self.test_questions, generated):
                 test_cases.append({
-                    'question_id': question_data['id'],
-                    'question': question_data['question'],
-                    'category': question_data['category'],
-                    'complexity': question_data['complexity'],
+                    'question_id': q.id,
+                    'question': q.question,
+                    'category': q.category,
+                    'complexity': q.complexity,
                     'generated_sql': generated_sql,
-                    'ground_truth_sql': question_data['ground_truth_sql']
+                    'ground_truth_sql': q.ground_truth_sql
                 })
 
             # Evaluate
@@ -249,21 +420,21 @@ class ExperimentRunner:
             results_df['selection_strategy'] = strategy
             results_df['experiment_name'] = experiment_name
 
+            # Save each strategy as soon as it is evaluated
+            self._append_csv(results_df, output_path, first_write=not all_results)
             all_results.append(results_df)
 
             # Print summary
             accuracy = (results_df['execution_success'].sum() / len(results_df)) * 100
-            print(f"✓ Execution Accuracy: {accuracy:.2f}%")
+            logger.info(f"✓ Execution Accuracy: {accuracy:.2f}%")
+            _flush_log()
 
-        # Combine results
+        # Combine results (already saved strategy by strategy)
         combined_df = pd.concat(all_results, ignore_index=True)
-
-        # Save
-        output_path = self.results_dir / f"{experiment_name}.csv"
-        combined_df.to_csv(output_path, index=False)
-        print(f"\n✓ Results saved to: {output_path}")
+        logger.info(f"\n✓ Results saved to: {output_path}")
 
         self._generate_experiment_summary(combined_df, experiment_name)
+        _flush_log()
 
         return combined_df
 
@@ -271,7 +442,8 @@ class ExperimentRunner:
         self,
         num_examples: int = 15,
         model_name: str = "llama-3.3-70b-versatile",
-        experiment_name: Optional[str] = None
+        experiment_name: Optional[str] = None,
+        requests_per_minute: float = 24
     ) -> pd.DataFrame:
         """
         Experiment 3: Analyze which SQL patterns are most difficult
@@ -280,6 +452,7 @@ class ExperimentRunner:
             num_examples: Number of few-shot examples
             model_name: LLM model
             experiment_name: Custom experiment name
+            requests_per_minute: LLM request budget (Groq free tier: ~30 requests/min)
 
         Returns:
             DataFrame with pattern analysis
@@ -287,34 +460,27 @@ class ExperimentRunner:
         if experiment_name is None:
             experiment_name = f"pattern_difficulty_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
-        print(f"\n{'='*80}")
-        print(f"EXPERIMENT: SQL Pattern Difficulty Analysis")
-        print(f"Model: {model_name}")
-        print(f"{'='*80}\n")
+        logger.info(f"\n{'='*80}")
+        logger.info(f"EXPERIMENT: SQL Pattern Difficulty Analysis")
+        logger.info(f"Model: {model_name}")
+        logger.info(f"{'='*80}\n")
 
         # Create agent
-        agent = self._create_agent_with_n_examples(num_examples, model_name)
+        agent = self._agent_with_n_examples(num_examples, model_name)
 
         # Run on all test questions
-        test_cases = []
-        for i, question_data in enumerate(self.test_data['test_questions'], 1):
-            print(f"Processing question {i}/{len(self.test_data['test_questions'])}: {question_data['id']}")
-
-            # Add delay to respect rate limits (Groq free tier: ~30 requests/min)
-            if i > 1:
-                time.sleep(2.5)  # 2.5 seconds between requests = ~24 requests/min
-
-            result = agent.generate(question_data['question'])
-            generated_sql = result.get('sql_query', '')
+        generated = self._generate_all(agent, requests_per_minute)
 
+        test_cases = []
+        for q, generated_sql in zip(self.test_questions, generated):
             test_cases.append({
-                'question_id': question_data['id'],
-                'question': question_data['question'],
-                'category': question_data['category'],
-                'complexity': question_data['complexity'],
-                'sql_pattern': question_data.get('sql_pattern', 'unknown'),
+                'question_id': q.id,
+                'question': q.question,
+                'category': q.category,
+                'complexity': q.complexity,
+                'sql_pattern': q.sql_pattern,
                 'generated_sql': generated_sql,
-                'ground_truth_sql': question_data['ground_truth_sql']
+                'ground_truth_sql': q.ground_truth_sql
             })
 
         # Evaluate
@@ -324,25 +490,22 @@ class ExperimentRunner:
             model_name=model_name
         )
 
-        # Add pattern information
-        for i, test_case in enumerate(test_cases):
-            results_df.at[i, 'sql_pattern'] = test_case['sql_pattern']
+        # Add pattern information (batch_evaluate keeps test-case order)
+        results_df['sql_pattern'] = [test_case['sql_pattern'] for test_case in test_cases]
 
         results_df['experiment_name'] = experiment_name
 
-        # Analyze by pattern
-        pattern_analysis = results_df.groupby('sql_pattern').agg({
-            'execution_success': 'mean',
-            'results_match': 'mean',
-            'sql_similarity_score': 'mean',
-            'question_id': 'count'
-        }).round(4)
+        # Analyze by pattern: one mean over the bool/float metric columns plus group sizes,
+        # rather than a per-column agg() dict
+        by_pattern = results_df.groupby('sql_pattern')
+        pattern_analysis = by_pattern[['execution_success', 'results_match', 'sql_similarity_score']].mean()
+        pattern_analysis['count'] = by_pattern.size()
+        pattern_analysis = pattern_analysis.round(4)
 
         pattern_analysis.columns = ['execution_rate', 'correctness_rate', 'avg_similarity', 'count']
         pattern_analysis = pattern_analysis.sort_values('execution_rate', ascending=False)
 
-        print("\n--- Pattern Difficulty Analysis ---")
-        print(pattern_analysis)
+        logger.info(f"\n--- Pattern Difficulty Analysis ---\n{pattern_analysis}")
 
         # Save
         output_path = self.results_dir / f"{experiment_name}.csv"
@@ -351,112 +514,168 @@ class ExperimentRunner:
         pattern_path = self.analysis_dir / f"{experiment_name}_pattern_analysis.csv"
         pattern_analysis.to_csv(pattern_path)
 
-        print(f"\n✓ Results saved to: {output_path}")
-        print(f"✓ Pattern analysis saved to: {pattern_path}")
+        logger.info(f"\n✓ Results saved to: {output_path}")
+        logger.info(f"✓ Pattern analysis saved to: {pattern_path}")
+        _flush_log()
 
         return results_df
 
-    def _create_agent_with_n_examples(self, n: int, model_name: str) -> SQLGeneratorAgent:
-        """Create SQL generator agent with first N examples"""
-        from few_shot_examples import examples
-
-        # Save original examples
-        original_examples = examples.FEW_SHOT_EXAMPLES
+    def _generate_all(
+        self,
+        agent: SQLGeneratorAgent,
+        requests_per_minute: float,
+        fix_failures: bool = False
+    ) -> List[Optional[str]]:
+        """
+        Generate SQL for every test question, in test-set order
 
-        try:
-            # Modify examples list based on n
-            if n == 0:
-                examples.FEW_SHOT_EXAMPLES = []
-            elif n >= len(FEW_SHOT_EXAMPLES):
-                examples.FEW_SHOT_EXAMPLES = FEW_SHOT_EXAMPLES
-            else:
-                examples.FEW_SHOT_EXAMPLES = FEW_SHOT_EXAMPLES[:n]
+        Questions run concurrently (up to MAX_CONCURRENT_REQUESTS) on worker threads, so
+        LLM latency overlaps; a shared RateLimiter keeps request starts within budget.
+        """
+        questions = self.test_questions
+        limiter = RateLimiter(requests_per_minute)
+        examples = list(agent.examples)
+        model_name = f"{agent.provider}:{agent.model_name}"
+
+        def generate(numbered):
+            i, q = numbered
+            question = q.question
+            cache_key = None
+            if self.response_cache is not None:
+                cache_key = ResponseCache.key(
+                    model_name, examples, agent.max_examples, question, agent.exclude_same_question
+                )
+                cached_sql = self.response_cache.get(cache_key)
+                if cached_sql is not None:
+                    logger.info(f"Processing question {i}/{len(questions)}: {q.id} (cached)")
+                    return cached_sql
+
+            logger.info(f"Processing question {i}/{len(questions)}: {q.id}")
+            return self._generate_sql(agent, question, limiter, fix_failures, cache_key)
+
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="llm") as pool:
+            return list(pool.map(generate, enumerate(questions, 1)))
+
+    def _generate_sql(
+        self,
+        agent: SQLGeneratorAgent,
+        question: str,
+        limiter: RateLimiter,
+        fix_failures: bool,
+        cache_key: Optional[str] = None
+    ) -> Optional[str]:
+        """Generate SQL for one question, backing off on rate limits and optionally attempting a fix"""
+        for attempt in range(MAX_RETRIES):
+            limiter.wait()
+            result = agent.generate(question)
+            generated_sql = result.get('sql_query', '')
 
+            # Check if rate limited
+            if result.get('error') and 'rate limit' in result.get('error', '').lower():
+                if attempt < MAX_RETRIES - 1:
+                    # Wait as long as the provider asks (plus a margin), else back off exponentially;
+                    # the pause applies to all workers since they share the budget
+                    retry_after = _retry_after(result['error'])
+                    retry_delay = retry_after + 1 if retry_after is not None else RETRY_DELAY * 2 ** attempt
+                    logger.warning(f"  ⚠ Rate limited. Waiting {retry_delay:.1f}s before retry {attempt + 2}/{MAX_RETRIES}...")
+                    limiter.pause(retry_delay)
+                    continue
+                else:
+                    logger.warning(f"  ❌ Rate limit persists after {MAX_RETRIES} attempts")
+            break
+
+        # Only first-pass generations are cached; fixes depend on the experiment's fix policy
+        if cache_key is not None and generated_sql and not result.get('error'):
+            self.response_cache.put(cache_key, generated_sql)
+
+        # If generation failed, try to fix
+        if fix_failures and (result.get('error') or not generated_sql):
+            error_msg = result.get('error') or 'No SQL generated'
+            logger.warning(f"  ⚠ Generation failed: {error_msg[:100]}")
+
+            # Don't attempt fix if rate limited
+            if 'rate limit' not in error_msg.lower():
+                logger.info(f"     Attempting fix...")
+                limiter.wait()  # The fix is another LLM request
+                fix_result = agent.fix_query(
+                    question,
+                    generated_sql or "SELECT 1;",
+                    error_msg
+                )
+                generated_sql = fix_result.get('sql_query', generated_sql)
+                if fix_result.get('error'):
+                    logger.warning(f"     Fix also failed: {fix_result.get('error')[:100]}")
+
+        return generated_sql
+
+    def _get_agent(self, model_name: str) -> SQLGeneratorAgent:
+        """SQL generator agent for model_name, created once and shared across buckets and experiments"""
+        agent = self._agents.get(model_name)
+        if agent is None:
             # Create agent with specified model and provider (defaults to huggingface)
             agent = SQLGeneratorAgent(
                 model_name=model_name,
                 provider='huggingface',  # Use HuggingFace by default
-                max_examples=n if n > 0 else 5
+                # Several test questions are example questions verbatim; answering them
+                # from the stored example SQL would score a lookup, not the model
+                semantic_cache=False
             )
+            self._agents[model_name] = agent
+        return agent
 
-            return agent
-        finally:
-            # Always restore original examples
-            examples.FEW_SHOT_EXAMPLES = original_examples
+    def _agent_with_n_examples(self, n: int, model_name: str) -> SQLGeneratorAgent:
+        """Shared agent, switched to the first N examples"""
+        agent = self._get_agent(model_name)
+        agent.set_examples(FEW_SHOT_EXAMPLES[:n], max_examples=n)
+        return agent
 
-    def _create_agent_with_examples(self, selected_examples: List[Dict], model_name: str):
-        """Create agent with specific examples"""
-        from few_shot_examples import examples
-
-        # Save original examples
-        original_examples = examples.FEW_SHOT_EXAMPLES
-
-        try:
-            # Set selected examples
-            examples.FEW_SHOT_EXAMPLES = selected_examples
-
-            # Create agent with specified model and provider
-            agent = SQLGeneratorAgent(
-                model_name=model_name,
-                provider='huggingface',  # Use HuggingFace by default
-                max_examples=len(selected_examples)
-            )
-
-            return agent
-        finally:
-            # Always restore original examples
-            examples.FEW_SHOT_EXAMPLES = original_examples
+    def _agent_with_examples(
+        self,
+        selected_examples: List[Dict],
+        model_name: str,
+        max_examples: Optional[int] = None,
+        exclude_same_question: bool = False
+    ) -> SQLGeneratorAgent:
+        """
+        Shared agent, switched to specific examples (at most max_examples per prompt, default all).
+        With exclude_same_question, an example matching the question asked is never selected.
+        """
+        agent = self._get_agent(model_name)
+        agent.set_examples(
+            selected_examples,
+            max_examples=len(selected_examples) if max_examples is None else max_examples,
+            exclude_same_question=exclude_same_question
+        )
+        return agent
 
     def _select_examples(self, strategy: str, n: int) -> List[Dict]:
-        """Select few-shot examples based on strategy"""
+        """
+        Select few-shot examples based on strategy
+
+        'random' and 'pattern_based' pick the same n examples for every question.
+        'similarity_based' returns the whole pool: the agent's semantic selector then
+        picks the n examples closest to each question (cached embeddings + BM25),
+        skipping any example that is the test question itself.
+        """
         if strategy == 'random':
             return random.sample(FEW_SHOT_EXAMPLES, min(n, len(FEW_SHOT_EXAMPLES)))
 
         elif strategy == 'pattern_based':
             # Select examples covering different patterns
             # Prioritize pattern diversity, then fill remaining slots
-            selected = []
-            patterns_seen = set()
-
-            # First pass: Select one example per unique pattern
-            for example in FEW_SHOT_EXAMPLES:
-                if len(selected) >= n:
-                    break
-
-                # Identify pattern by keywords in SQL
-                sql = example['sql_query'].upper()
-                pattern = []
-                if 'WITH' in sql:
-                    pattern.append('CTE')
-                if 'WINDOW' in sql or 'OVER' in sql:
-                    pattern.append('WINDOW')
-                if 'CASE' in sql:
-                    pattern.append('CASE')
-
-                pattern_key = '-'.join(pattern) if pattern else 'SIMPLE'
-
-                # Only add if pattern not seen yet
-                if pattern_key not in patterns_seen:
-                    selected.append(example)
-                    patterns_seen.add(pattern_key)
-
-            # Second pass: If we need more examples, add remaining ones
-            if len(selected) < n:
-                for example in FEW_SHOT_EXAMPLES:
-                    if len(selected) >= n:
-                        break
-                    if example not in selected:
-                        selected.append(example)
-
-            return selected[:n]
+            return [FEW_SHOT_EXAMPLES[i] for i in _PATTERN_BASED_ORDER[:n]]
 
         elif strategy == 'similarity_based':
-            # For now, just return first N (in production, would use embedding similarity)
-            return FEW_SHOT_EXAMPLES[:n]
+            # Chosen per question by the agent (max_examples=n), not here
+            return list(FEW_SHOT_EXAMPLES)
 
         else:
             raise ValueError(f"Unknown strategy: {strategy}")
 
+    def _append_csv(self, results_df: pd.DataFrame, output_path: Path, first_write: bool):
+        """Write one bucket's results to the experiment CSV (header on the first write only)"""
+        results_df.to_csv(output_path, mode='w' if first_write else 'a', header=first_write, index=False)
+
     def _generate_experiment_summary(self, results_df: pd.DataFrame, experiment_name: str):
         """Generate and save experiment summary"""
         summary = {
@@ -471,13 +690,13 @@ class ExperimentRunner:
         with open(summary_path, 'w') as f:
             json.dump(summary, f, indent=2)
 
-        print(f"✓ Summary saved to: {summary_path}")
+        logger.info(f"✓ Summary saved to: {summary_path}")
 
         # Print key metrics
-        print("\n--- Experiment Summary ---")
-        print(f"Execution Accuracy: {summary['overall_metrics']['execution_accuracy']:.2f}%")
-        print(f"Semantic Correctness: {summary['overall_metrics']['semantic_correctness']:.2f}%")
-        print(f"Avg SQL Similarity: {summary['overall_metrics']['avg_sql_similarity']:.2f}%")
+        logger.info("\n--- Experiment Summary ---")
+        logger.info(f"Execution Accuracy: {summary['overall_metrics']['execution_accuracy']:.2f}%")
+        logger.info(f"Semantic Correctness: {summary['overall_metrics']['semantic_correctness']:.2f}%")
+        logger.info(f"Avg SQL Similarity: {summary['overall_metrics']['avg_sql_similarity']:.2f}%")
 
 
 if __name__ == "__main__":
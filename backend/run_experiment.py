@@ -5,7 +5,6 @@ Run NL2SQL few-shot learning experiments easily
 
 import argparse
 from pathlib import Path
-from research.experiment_runner import ExperimentRunner
 
 
 def run_few_shot_experiment(num_examples=None, model='meta-llama/Meta-Llama-3.1-70B-Instruct'):
@@ -20,6 +19,8 @@ def run_few_shot_experiment(num_examples=None, model='meta-llama/Meta-Llama-3.1-
     print(f"Model: {model}")
     print("="*80 + "\n")
 
+    # Imported here so --help and bad arguments don't wait on pandas/LangChain
+    from research.experiment_runner import ExperimentRunner
     runner = ExperimentRunner('experiments/data/test_questions.json')
     results = runner.run_few_shot_experiment(
         num_examples_list=num_examples,
@@ -38,6 +39,7 @@ def run_selection_strategy_experiment(num_examples=10, model='meta-llama/Meta-Ll
     print(f"Model: {model}")
     print("="*80 + "\n")
 
+    from research.experiment_runner import ExperimentRunner
     runner = ExperimentRunner('experiments/data/test_questions.json')
     results = runner.run_selection_strategy_experiment(
         strategies=['random', 'pattern_based', 'similarity_based'],
@@ -57,6 +59,7 @@ def run_pattern_difficulty_experiment(num_examples=15, model='meta-llama/Meta-Ll
     print(f"Model: {model}")
     print("="*80 + "\n")
 
+    from research.experiment_runner import ExperimentRunner
     runner = ExperimentRunner('experiments/data/test_questions.json')
     results = runner.run_pattern_difficulty_experiment(
         num_examples=num_examples,
@@ -0,0 +1,27 @@
+"""
+Tests for converting query results to the API's columnar payload
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.columnar import to_columnar
+
+
+def test_columns_keep_order_and_values():
+    df = pd.DataFrame({"fiscal_year": [2023, 2024], "revenue": [59414.0, 62849.0]})
+    columns, results = to_columnar(df)
+    assert columns == ["fiscal_year", "revenue"]
+    assert results == {"fiscal_year": [2023, 2024], "revenue": [59414.0, 62849.0]}
+
+
+def test_repeated_column_names_are_made_unique():
+    # What pd.read_sql_query returns for SELECT a.value, b.value, ...
+    df = pd.DataFrame([[2024, 1.0, 2.0, 3.0]], columns=["fiscal_year", "value", "value", "value_1"])
+    columns, results = to_columnar(df)
+    assert columns == ["fiscal_year", "value", "value_2", "value_1"]
+    assert list(results) == columns
+    assert results == {"fiscal_year": [2024], "value": [1.0], "value_2": [2.0], "value_1": [3.0]}
@@ -0,0 +1,40 @@
+"""
+Tests that the vectorized numeric cleaning matches the per-cell clean_numeric
+"""
+
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from db.setup import NA_VALUES, clean_numeric, clean_numeric_series
+
+TRICKY_CELLS = [
+    "1,234", "(1,234)", "(1,234.5)", "(5%)", "12%", " 1.5 ", "\t7\n", "+5", "-3", "1e3", ".5", "1.",
+    "1_000", "(1_000)", "_1", "1__0", "1_", "inf", "-inf", "Infinity", "nan",
+    "()", "(", "-", "", "  -  ", "abc", "1 000", "1,2,3", "0x10", "--1", "(-1)", "e5",
+    True, False, 3, 2.5, np.int64(4), np.float32(1.5), None, np.nan,
+    *NA_VALUES,
+]
+
+
+def _same(a, b):
+    a = np.nan if a is None else a
+    return (math.isnan(a) and math.isnan(b)) or a == b
+
+
+@pytest.mark.parametrize("cell", TRICKY_CELLS, ids=repr)
+def test_series_matches_per_cell(cell):
+    # a text neighbour keeps the column object-typed, as in a raw sheet
+    result = clean_numeric_series(pd.Series([cell, "label"], dtype=object))
+    assert _same(clean_numeric(cell), result[0])
+
+
+def test_numeric_column_fast_path():
+    result = clean_numeric_series(pd.Series([1, 2, 3]))
+    assert result.dtype == "float64"
+    assert result.tolist() == [1.0, 2.0, 3.0]
@@ -0,0 +1,32 @@
+"""
+Tests for reading the provider's retry hint out of rate-limit errors
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from research.experiment_runner import _retry_after
+
+
+@pytest.mark.parametrize("error, seconds", [
+    ("Rate limit reached. Please try again in 7.03s. Visit ...", 7.03),
+    ("Please try again in 2m5.1s.", 125.1),
+    ("Please try again in 1m30s", 90.0),
+    ("Please try again in 380ms.", 0.38),
+    ("Please try again in 12s", 12.0),
+    ("PLEASE TRY AGAIN IN 4.5S", 4.5),
+])
+def test_retry_after_parses_hint(error, seconds):
+    assert _retry_after(error) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("error", [
+    "Error code: 429 - rate_limit_exceeded",
+    "Please try again later.",
+    "",
+])
+def test_retry_after_without_hint(error):
+    assert _retry_after(error) is None
@@ -0,0 +1,34 @@
+"""
+Tests for the read-only guard in front of query execution
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from agents.sql_executor import SQLExecutorAgent
+from utils.sql_validator import validate_sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT fiscal_year FROM fiscal_period",
+    "  with yearly AS (SELECT 1 AS v) SELECT v FROM yearly",
+    "SELECT updated_at, inserted_by FROM t",
+])
+def test_read_only_queries_pass(sql):
+    assert validate_sql(sql) == sql.strip()
+
+
+@pytest.mark.parametrize("sql", [
+    "DROP TABLE company",
+    "SELECT 1; DELETE FROM company",
+    "WITH gone AS (DELETE FROM company RETURNING *) SELECT * FROM gone",
+    "selectx 1",
+])
+def test_write_queries_are_rejected_before_reaching_the_database(sql):
+    # no connection is configured; the guard must answer first
+    result = SQLExecutorAgent().execute(sql)
+    assert result["results"] is None
+    assert result["error"].startswith("Rejected query:")
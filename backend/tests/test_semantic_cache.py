@@ -0,0 +1,93 @@
+"""
+Tests for SemanticCache lookups: similarity threshold, number matching and eviction
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+from few_shot_examples.semantic_selector import SemanticCache
+
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _cache(**kwargs):
+    return SemanticCache(
+        np.vstack([_unit(1, 0, 0), _unit(0, 1, 0)]),
+        ["What was the total revenue in 2024?", "Calculate working capital for each year"],
+        ["SELECT 'revenue';", "SELECT 'working capital';"],
+        **kwargs
+    )
+
+
+def test_lookup_hits_identical_question():
+    cache = _cache()
+    assert cache.lookup("What was the total revenue in 2024?", _unit(1, 0, 0)) == "SELECT 'revenue';"
+
+
+def test_lookup_respects_threshold():
+    cache = _cache(threshold=0.92)
+    # cosine ~0.95 with the first seed: a hit
+    assert cache.lookup("Total revenue in 2024?", _unit(1, 0.33, 0)) == "SELECT 'revenue';"
+    # cosine ~0.89: a miss
+    assert cache.lookup("Total revenue in 2024?", _unit(1, 0.5, 0)) is None
+
+
+def test_lookup_requires_same_numbers():
+    cache = _cache()
+    assert cache.lookup("What was the total revenue in 2023?", _unit(1, 0, 0)) is None
+    assert cache.lookup("What was the total revenue?", _unit(1, 0, 0)) is None
+
+
+def test_lookup_ignores_filler_and_punctuation():
+    cache = _cache()
+    assert cache.lookup("total revenue in 2024", _unit(1, 0, 0)) == "SELECT 'revenue';"
+    assert cache.lookup("Show me the total revenue for 2024.", _unit(1, 0, 0)) == "SELECT 'revenue';"
+
+
+def test_lookup_misses_different_question_with_same_embedding():
+    # Sentence embeddings rate these pairs as near-identical; the word check must not
+    cache = _cache()
+    cache.insert("Which year had the highest net profit?", _unit(0, 0, 1), "SELECT 'max';")
+    assert cache.lookup("Which year had the lowest net profit?", _unit(0, 0, 1)) is None
+    assert cache.lookup("What was the total expenses in 2024?", _unit(1, 0, 0)) is None
+    assert cache.lookup("Which year had the highest net profit", _unit(0, 0, 1)) == "SELECT 'max';"
+
+
+def test_eviction_keeps_seed_entries():
+    cache = _cache(max_entries=2)
+    for i in range(3):
+        cache.insert(f"learned question {i}", _unit(0, 0, 1) if i == 2 else _unit(0, 1, i + 1), f"SELECT {i};")
+
+    # Only the two newest learned entries remain
+    assert cache.lookup("learned question 0", _unit(0, 1, 1)) is None
+    assert cache.lookup("learned question 2", _unit(0, 0, 1)) == "SELECT 2;"
+    # Seeds survive eviction
+    assert cache.lookup("What was the total revenue in 2024?", _unit(1, 0, 0)) == "SELECT 'revenue';"
+    assert cache.lookup("Calculate working capital for each year", _unit(0, 1, 0)) == "SELECT 'working capital';"
+
+
+def test_clear_forgets_only_learned_entries():
+    cache = _cache()
+    cache.insert("Show inventory", _unit(0, 0, 1), "SELECT 'inventory';")
+    cache.clear()
+    assert cache.lookup("Show inventory", _unit(0, 0, 1)) is None
+    assert cache.lookup("What was the total revenue in 2024?", _unit(1, 0, 0)) == "SELECT 'revenue';"
+
+
+def test_load_discards_entries_saved_under_another_fingerprint(tmp_path):
+    cache = _cache()
+    cache.insert("Show inventory", _unit(0, 0, 1), "SELECT 'inventory';")
+    cache.save(tmp_path / "learned", "model@torch", "v1")
+
+    assert _cache().load(tmp_path / "learned", "model@torch", "v2") == 0
+    assert _cache().load(tmp_path / "learned", "model@onnx", "v1") == 0
+
+    restored = _cache()
+    assert restored.load(tmp_path / "learned", "model@torch", "v1") == 1
+    assert restored.lookup("Show inventory", _unit(0, 0, 1)) == "SELECT 'inventory';"
@@ -0,0 +1,37 @@
+"""
+Tests for cleaning LLM replies down to the SQL query
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from agents.sql_generator import _clean_sql
+
+
+def test_strips_code_fences():
+    assert _clean_sql("```sql\nSELECT 1\n```") == "SELECT 1;"
+    assert _clean_sql("```\nSELECT 1;\n```") == "SELECT 1;"
+
+
+def test_drops_preamble_before_query():
+    assert _clean_sql("Here is the query:\nselect revenue FROM t") == "select revenue FROM t;"
+
+
+def test_keywords_inside_words_are_not_query_starts():
+    assert _clean_sql("Without further ado: SELECT x FROM t") == "SELECT x FROM t;"
+    assert _clean_sql("Using selected_items: SELECT selected_items FROM t") == "SELECT selected_items FROM t;"
+
+
+def test_cte_starts_at_with():
+    sql = "WITH yearly AS (SELECT 1 AS v) SELECT v FROM yearly"
+    assert _clean_sql(f"Sure.\n```sql\n{sql}\n```") == f"{sql};"
+
+
+def test_terminator_added_once():
+    assert _clean_sql("SELECT 1") == "SELECT 1;"
+    assert _clean_sql("SELECT 1;") == "SELECT 1;"
+
+
+def test_reply_without_query_is_returned_as_is():
+    assert _clean_sql("I cannot answer that.") == "I cannot answer that."
@@ -0,0 +1,28 @@
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+
+def to_columnar(df: pd.DataFrame) -> Tuple[List[str], Dict[str, list]]:
+    """
+    Convert query results to (column names, {column: [values...]}) for the API response.
+
+    Columns are read by position, since SQL results can repeat a name (e.g. a.value,
+    b.value in a self-join); repeats are renamed value_1, value_2, ... so the names
+    stay unique and match the dict keys.
+    """
+    names = [str(name) for name in df.columns]
+    columns = []
+    taken = set(names)
+    seen = set()
+    for name in names:
+        unique, n = name, 0
+        if name in seen:
+            # Skip suffixes that are already some other column's name
+            while unique in taken:
+                n += 1
+                unique = f"{name}_{n}"
+            taken.add(unique)
+        seen.add(name)
+        columns.append(unique)
+    return columns, {col: df.iloc[:, i].tolist() for i, col in enumerate(columns)}
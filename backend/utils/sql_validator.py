@@ -1,5 +1,10 @@
 import re
 
+# Whole words only, so identifiers like updated_at or inserted_by don't match
+_FORBIDDEN_RE = re.compile(r"\b(?:delete|drop|update|insert|truncate|alter|grant|revoke)\b", re.IGNORECASE)
+_HEAD_RE = re.compile(r"(?:select|with)\b", re.IGNORECASE)
+_FENCE_RE = re.compile(r"```")
+
 def validate_sql(sql):
     """
     Basic SQL validation for PostgreSQL:
@@ -9,16 +14,13 @@ def validate_sql(sql):
     sql = sql.strip()
     
     # Accept queries starting with SELECT or WITH
-    if not (sql.lower().startswith("select") or sql.lower().startswith("with")):
+    if not _HEAD_RE.match(sql):
         raise ValueError("Only SELECT queries or CTE-based SELECT queries are allowed.")
 
     # Forbidden keywords
-    forbidden = [
-        "delete", "drop", "update", "insert", "truncate", "alter", "grant", "revoke"
-    ]
-    if any(word in sql.lower() for word in forbidden):
+    if _FORBIDDEN_RE.search(sql):
         raise ValueError("Query contains forbidden operations.")
 
     # remove extra backticks or triple quotes
-    sql = re.sub(r"```", "", sql)
+    sql = _FENCE_RE.sub("", sql)
     return sql
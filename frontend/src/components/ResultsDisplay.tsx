@@ -37,9 +37,10 @@ const ResultsDisplay = ({ result }: ResultsDisplayProps) => {
   const exportToCSV = () => {
     if (!result.results) return;
 
+    const data = result.results;
     const headers = result.columns?.join(',') || '';
-    const rows = result.results.map(row => 
-      result.columns?.map(col => row[col]).join(',')
+    const rows = Array.from({ length: result.row_count }, (_, idx) =>
+      result.columns?.map(col => data[col][idx]).join(',')
     ).join('\n');
     
     const csv = `${headers}\n${rows}`;
@@ -174,18 +175,21 @@ const ResultsDisplay = ({ result }: ResultsDisplayProps) => {
                     </tr>
                   </thead>
                   <tbody className="bg-white divide-y divide-gray-200">
-                    {result.results.map((row, idx) => (
+                    {Array.from({ length: result.row_count }, (_, idx) => (
                       <tr key={idx} className="hover:bg-gray-50">
-                        {result.columns?.map((col) => (
-                          <td
-                            key={col}
-                            className="px-6 py-4 whitespace-nowrap text-sm text-gray-900"
-                          >
-                            {typeof row[col] === 'number' 
-                              ? row[col].toLocaleString(undefined, { maximumFractionDigits: 2 })
-                              : row[col] ?? 'N/A'}
-                          </td>
-                        ))}
+                        {result.columns?.map((col) => {
+                          const value = result.results![col][idx];
+                          return (
+                            <td
+                              key={col}
+                              className="px-6 py-4 whitespace-nowrap text-sm text-gray-900"
+                            >
+                              {typeof value === 'number'
+                                ? value.toLocaleString(undefined, { maximumFractionDigits: 2 })
+                                : value ?? 'N/A'}
+                            </td>
+                          );
+                        })}
                       </tr>
                     ))}
                   </tbody>
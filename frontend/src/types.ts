@@ -2,7 +2,7 @@ export interface AnalysisResult {
   analysis_id: string;
   question: string;
   sql_query: string | null;
-  results: Record<string, any>[] | null;
+  results: Record<string, any[]> | null; // columnar: column -> values
   columns: string[] | null;
   row_count: number;
   insights: string | null;